@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Utilitários comuns às APIs simuladas
+Lock, paginação por cursor e exportação NDJSON dos dados em memória, usados
+pela API de e-commerce e pela de CRM.
+"""
+
+import json
+import threading
+import zlib
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Protege listas, índices e agregados da API: a thread do simulador escreve e
+# os endpoints leem. Cada API roda no seu processo, então o lock é por API
+db_lock = threading.Lock()
+
+def pagina_apos(registros: List[Dict[str, Any]], after_id: Optional[int], limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Próximos `limit` registros com id > after_id, em ordem de id
+
+    Os ids vêm de contadores sequenciais a partir de 1 e as listas só recebem
+    append, então o registro de id N está na posição N-1 e a página começa
+    direto no cursor, sem percorrer o histórico. Sem after_id devolve os
+    últimos `limit` registros. Retorna (página, next_cursor), em que
+    next_cursor é o id do último registro da página (ou o próprio cursor).
+    """
+    if after_id is None:
+        inicio = max(0, len(registros) - limit)
+        pagina = registros[inicio:]
+    else:
+        inicio = max(0, after_id)
+        pagina = registros[inicio:inicio + limit]
+    return pagina, inicio + len(pagina)
+
+def pagina_ids(ids: List[int], registros: List[Dict[str, Any]], after_id: Optional[int],
+               limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Como pagina_apos, mas só entre os registros de `ids` (em ordem crescente)
+
+    Usado nas listagens filtradas: `ids` são os registros que passam no filtro.
+    """
+    if after_id is None:
+        selecionados = ids[max(0, len(ids) - limit):]
+    else:
+        inicio = bisect_right(ids, after_id)
+        selecionados = ids[inicio:inicio + limit]
+    next_cursor = selecionados[-1] if selecionados else (after_id or 0)
+    return [registros[i - 1] for i in selecionados], next_cursor
+
+# Registros serializados por bloco no /export: o NDJSON sai em pedaços, sem
+# montar a lista inteira nem o documento JSON completo em memória
+EXPORT_CHUNK_SIZE = 1000
+
+def exportar_ndjson(registros: List[Dict[str, Any]], after_id: int, comprimir: bool) -> Iterator[bytes]:
+    """Gera os registros com id > after_id como NDJSON, em blocos
+
+    Usa a mesma convenção de posição de pagina_apos. O fim é fixado no início
+    da exportação: registros criados durante o download ficam para a próxima,
+    a partir do último id recebido.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if comprimir else None  # formato gzip
+    fim = len(registros)
+    
+    for inicio in range(max(0, after_id), fim, EXPORT_CHUNK_SIZE):
+        bloco = registros[inicio:min(inicio + EXPORT_CHUNK_SIZE, fim)]
+        dados = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in bloco).encode("utf-8")
+        if compressor:
+            dados = compressor.compress(dados)
+        if dados:
+            yield dados
+    
+    if compressor:
+        yield compressor.flush()
@@ -5,15 +5,19 @@ Simula um sistema de CRM com leads, oportunidades e campanhas
 Para demonstrar CDC e integração multi-fonte
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 import uvicorn
 import random
+from bisect import bisect_left, insort
 from datetime import datetime, timedelta
 from faker import Faker
 import time
 import threading
 import logging
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional
+
+from api_comum import db_lock, exportar_ndjson, pagina_apos, pagina_ids
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s : %(message)s')
 logger = logging.getLogger(__name__)
@@ -33,6 +37,18 @@ oportunidade_id_counter = 1
 campanha_id_counter = 1
 atividade_id_counter = 1
 
+# Agregados do /stats, atualizados (sob db_lock) a cada lead, atividade e
+# mudança de status em vez de recalculados sobre todo o histórico
+soma_scores = 0
+leads_por_status: Dict[str, int] = {}
+atividades_por_tipo: Dict[str, int] = {}
+
+# Índices secundários dos filtros das listagens, também sob db_lock: ids de
+# leads por status (em minúsculas) e de atividades por lead, sempre em ordem
+# crescente, no formato que pagina_ids espera
+ids_leads_por_status: Dict[str, List[int]] = {}
+ids_atividades_por_lead: Dict[int, List[int]] = {}
+
 def gerar_campanhas_iniciais():
     """Gera campanhas de marketing"""
     global campanha_id_counter
@@ -83,7 +99,7 @@ def gerar_leads_iniciais():
             "orcamento_estimado": round(random.uniform(1000, 100000), 2),
             "observacoes": fake.text(max_nb_chars=300)
         }
-        leads_db.append(lead)
+        registrar_lead(lead)
         
         # Atualizar contador da campanha
         if campanha:
@@ -91,6 +107,34 @@ def gerar_leads_iniciais():
             
         lead_id_counter += 1
 
+def registrar_lead(lead: Dict[str, Any]) -> None:
+    """Acrescenta o lead e atualiza os agregados do /stats e os índices"""
+    global soma_scores
+    
+    with db_lock:
+        leads_db.append(lead)
+        ids_leads_por_status.setdefault(lead["status"].lower(), []).append(lead["id"])
+        soma_scores += lead["score"]
+        leads_por_status[lead["status"]] = leads_por_status.get(lead["status"], 0) + 1
+
+def alterar_status_lead(lead: Dict[str, Any], status: str) -> None:
+    """Muda o status do lead movendo a contagem e o id entre os status"""
+    with db_lock:
+        ids = ids_leads_por_status[lead["status"].lower()]
+        del ids[bisect_left(ids, lead["id"])]
+        insort(ids_leads_por_status.setdefault(status.lower(), []), lead["id"])
+        
+        leads_por_status[lead["status"]] -= 1
+        leads_por_status[status] = leads_por_status.get(status, 0) + 1
+        lead["status"] = status
+
+def registrar_atividade(atividade: Dict[str, Any]) -> None:
+    """Acrescenta a atividade e atualiza os agregados do /stats e os índices"""
+    with db_lock:
+        atividades_db.append(atividade)
+        ids_atividades_por_lead.setdefault(atividade["lead_id"], []).append(atividade["id"])
+        atividades_por_tipo[atividade["tipo"]] = atividades_por_tipo.get(atividade["tipo"], 0) + 1
+
 def simular_atividades():
     """Simula atividades de CRM em tempo real"""
     global atividade_id_counter
@@ -114,7 +158,7 @@ def simular_atividades():
                     "responsavel": fake.name()
                 }
                 
-                atividades_db.append(atividade)
+                registrar_atividade(atividade)
                 
                 # Atualizar último contato do lead
                 lead["ultimo_contato"] = atividade["data_atividade"]
@@ -122,11 +166,11 @@ def simular_atividades():
                 # 20% chance de alterar status do lead
                 if random.random() < 0.2:
                     if lead["status"] == "Novo":
-                        lead["status"] = "Contactado"
+                        alterar_status_lead(lead, "Contactado")
                     elif lead["status"] == "Contactado":
-                        lead["status"] = random.choice(["Qualificado", "Perdido"])
+                        alterar_status_lead(lead, random.choice(["Qualificado", "Perdido"]))
                     elif lead["status"] == "Qualificado":
-                        lead["status"] = random.choice(["Convertido", "Perdido"])
+                        alterar_status_lead(lead, random.choice(["Convertido", "Perdido"]))
                 
                 atividade_id_counter += 1
                 logger.info(f" Nova atividade: {atividade['tipo']} com lead {lead['nome']}")
@@ -161,23 +205,28 @@ async def root() -> Dict[str, Any]:
             "/campanhas",
             "/atividades",
             "/stats",
+            "/export/{entidade}",
             "/health"
         ]
     }
 
 @app.get("/leads")
-async def listar_leads(limit: int = 100, status: str = "") -> Dict[str, Any]:
-    """Lista leads"""
-    leads = leads_db
-    
+async def listar_leads(limit: int = 100, status: str = "", after_id: Optional[int] = None) -> Dict[str, Any]:
+    """Lista leads
+
+    Com after_id pagina por id a partir do cursor (ver pagina_apos). O cursor
+    acompanha leads novos; mudanças de status em leads já lidos não reaparecem.
+    """
     if status:
-        leads = [l for l in leads if l['status'].lower() == status.lower()]
-    
-    leads = leads[-limit:]
+        with db_lock:
+            leads, next_cursor = pagina_ids(ids_leads_por_status.get(status.lower(), []), leads_db, after_id, limit)
+    else:
+        leads, next_cursor = pagina_apos(leads_db, after_id, limit)
     
     return {
         "total": len(leads),
         "dados": leads,
+        "next_cursor": next_cursor,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -191,43 +240,40 @@ async def listar_campanhas(limit: int = 50) -> Dict[str, Any]:
     }
 
 @app.get("/atividades")
-async def listar_atividades(limit: int = 100, lead_id: int = 0) -> Dict[str, Any]:
-    """Lista atividades"""
-    atividades = atividades_db
-    
+async def listar_atividades(limit: int = 100, lead_id: int = 0, after_id: Optional[int] = None) -> Dict[str, Any]:
+    """Lista atividades
+
+    Com after_id pagina por id a partir do cursor (ver pagina_apos).
+    """
     if lead_id and lead_id > 0:
-        atividades = [a for a in atividades if a['lead_id'] == lead_id]
-    
-    atividades = atividades[-limit:]
+        with db_lock:
+            atividades, next_cursor = pagina_ids(ids_atividades_por_lead.get(lead_id, []), atividades_db, after_id, limit)
+    else:
+        atividades, next_cursor = pagina_apos(atividades_db, after_id, limit)
     
     return {
         "total": len(atividades),
         "dados": atividades,
+        "next_cursor": next_cursor,
         "timestamp": datetime.now().isoformat()
     }
 
 @app.get("/stats")
 async def estatisticas() -> Dict[str, Any]:
-    """Estatísticas do CRM"""
-    # Leads por status
-    leads_por_status = {}
-    for lead in leads_db:
-        status = lead['status']
-        leads_por_status[status] = leads_por_status.get(status, 0) + 1
+    """Estatísticas do CRM (agregados mantidos por registrar_lead, alterar_status_lead e registrar_atividade)"""
+    with db_lock:
+        total_leads = len(leads_db)
+        total_atividades = len(atividades_db)
+        por_status = {status: n for status, n in leads_por_status.items() if n}
+        por_tipo = dict(atividades_por_tipo)
+        score_total = soma_scores
     
     # Taxa de conversão
-    total_leads = len(leads_db)
-    leads_convertidos = len([l for l in leads_db if l['status'] == 'Convertido'])
+    leads_convertidos = por_status.get('Convertido', 0)
     taxa_conversao = (leads_convertidos / max(1, total_leads)) * 100
     
     # Score médio
-    score_medio = sum(l['score'] for l in leads_db) / max(1, len(leads_db))
-    
-    # Atividades por tipo
-    atividades_por_tipo = {}
-    for atividade in atividades_db:
-        tipo = atividade['tipo']
-        atividades_por_tipo[tipo] = atividades_por_tipo.get(tipo, 0) + 1
+    score_medio = score_total / max(1, total_leads)
     
     return {
         "resumo": {
@@ -236,13 +282,32 @@ async def estatisticas() -> Dict[str, Any]:
             "taxa_conversao": round(taxa_conversao, 2),
             "score_medio": round(score_medio, 1),
             "total_campanhas": len(campanhas_db),
-            "total_atividades": len(atividades_db)
+            "total_atividades": total_atividades
         },
-        "leads_por_status": leads_por_status,
-        "atividades_por_tipo": atividades_por_tipo,
+        "leads_por_status": por_status,
+        "atividades_por_tipo": por_tipo,
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/export/{entidade}")
+async def exportar(entidade: str, after_id: int = 0, gzip: bool = False) -> StreamingResponse:
+    """Exporta leads, oportunidades, campanhas e atividades em NDJSON, em blocos (ver api_comum.exportar_ndjson)
+
+    ?gzip=true comprime o fluxo (Content-Encoding: gzip).
+    """
+    registros = {
+        "leads": leads_db,
+        "oportunidades": oportunidades_db,
+        "campanhas": campanhas_db,
+        "atividades": atividades_db,
+    }.get(entidade)
+    if registros is None:
+        raise HTTPException(status_code=404, detail=f"Entidade desconhecida: {entidade}")
+    
+    headers = {"Content-Encoding": "gzip"} if gzip else {}
+    return StreamingResponse(exportar_ndjson(registros, after_id, gzip),
+                             media_type="application/x-ndjson", headers=headers)
+
 if __name__ == "__main__":
     logger.info(" Iniciando API CRM na porta 8000...")
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -6,16 +6,20 @@ Para demonstrar CDC e integração multi-fonte
 """
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
 import pandas as pd
 import random
+import heapq
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from faker import Faker
 import time
 import threading
 import logging
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional
+
+from api_comum import db_lock, exportar_ndjson, pagina_apos
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s : %(message)s')
 logger = logging.getLogger(__name__)
@@ -28,6 +32,23 @@ produtos_db = []
 vendas_db = []
 clientes_ecommerce_db = []
 
+# data_venda de cada venda em epoch, na mesma posição de vendas_db. As vendas
+# só são acrescentadas, em ordem de data, então o array fica ordenado e o
+# filtro por data_inicio é uma busca binária
+vendas_ts = []
+
+# Índices secundários dos filtros das listagens: produtos por categoria (em
+# minúsculas) e clientes VIP, na ordem de cadastro. Produtos e clientes só são
+# criados na inicialização e esses campos não mudam depois
+produtos_por_categoria: Dict[str, List[Dict[str, Any]]] = {}
+clientes_vip_db: List[Dict[str, Any]] = []
+
+# Agregados do /stats, atualizados a cada venda (sob db_lock) em vez de
+# recalculados sobre todo o histórico
+receita_total = 0.0
+vendas_por_status: Dict[str, int] = {}
+vendas_por_produto: Dict[int, int] = {}
+
 # Contadores para IDs
 produto_id_counter = 1
 venda_id_counter = 1
@@ -55,6 +76,7 @@ def gerar_produtos_iniciais():
             "ativo": random.choice([True, True, True, False])  # 75% ativos
         }
         produtos_db.append(produto)
+        produtos_por_categoria.setdefault(produto["categoria"].lower(), []).append(produto)
         produto_id_counter += 1
 
 def gerar_clientes_iniciais():
@@ -81,8 +103,25 @@ def gerar_clientes_iniciais():
             "valor_total_gasto": 0.0
         }
         clientes_ecommerce_db.append(cliente)
+        if cliente["vip"]:
+            clientes_vip_db.append(cliente)
         cliente_id_counter += 1
 
+def registrar_venda(venda: Dict[str, Any], data_venda: datetime) -> None:
+    """Acrescenta a venda ao histórico e atualiza os agregados do /stats"""
+    global receita_total
+    
+    with db_lock:
+        vendas_db.append(venda)
+        # Depois do append em vendas_db: vendas_ts nunca fica à frente
+        # e o índice da busca sempre aponta para a venda certa.
+        # max() protege a ordenação de um ajuste para trás no relógio
+        vendas_ts.append(max(data_venda.timestamp(), vendas_ts[-1] if vendas_ts else 0))
+        
+        receita_total += venda["valor_total"]
+        vendas_por_status[venda["status"]] = vendas_por_status.get(venda["status"], 0) + 1
+        vendas_por_produto[venda["produto_id"]] = vendas_por_produto.get(venda["produto_id"], 0) + venda["quantidade"]
+
 def simular_vendas():
     """Simula vendas em tempo real"""
     global venda_id_counter
@@ -94,6 +133,7 @@ def simular_vendas():
                 produto = random.choice([p for p in produtos_db if p['ativo']])
                 cliente = random.choice(clientes_ecommerce_db)
                 quantidade = random.randint(1, 3)
+                agora = datetime.now()
                 
                 venda = {
                     "id": venda_id_counter,
@@ -105,7 +145,7 @@ def simular_vendas():
                     "desconto": round(random.uniform(0, 0.15), 2) if random.random() < 0.3 else 0,
                     "metodo_pagamento": random.choice(["PIX", "Cartão de Crédito", "Cartão de Débito", "Boleto"]),
                     "status": random.choice(["Pendente", "Processando", "Enviado", "Entregue"]),
-                    "data_venda": datetime.now().isoformat(),
+                    "data_venda": agora.isoformat(),
                     "canal": random.choice(["Website", "Mobile App", "Marketplace"])
                 }
                 
@@ -114,7 +154,7 @@ def simular_vendas():
                     venda["valor_total"] *= (1 - venda["desconto"])
                     venda["valor_total"] = round(venda["valor_total"], 2)
                 
-                vendas_db.append(venda)
+                registrar_venda(venda, agora)
                 
                 # Atualizar estoque
                 produto["estoque"] = max(0, produto["estoque"] - quantidade)
@@ -159,6 +199,7 @@ async def root() -> Dict[str, Any]:
             "/vendas", 
             "/clientes",
             "/stats",
+            "/export/{entidade}",
             "/health"
         ]
     }
@@ -166,10 +207,12 @@ async def root() -> Dict[str, Any]:
 @app.get("/produtos")
 async def listar_produtos(limit: int = 100, categoria: str = "") -> Dict[str, Any]:
     """Lista produtos"""
-    produtos = produtos_db[:limit]
+    produtos = produtos_db
     
     if categoria:
-        produtos = [p for p in produtos if p['categoria'].lower() == categoria.lower()]
+        produtos = produtos_por_categoria.get(categoria.lower(), [])
+    
+    produtos = produtos[:limit]
     
     return {
         "total": len(produtos),
@@ -178,19 +221,35 @@ async def listar_produtos(limit: int = 100, categoria: str = "") -> Dict[str, An
     }
 
 @app.get("/vendas")
-async def listar_vendas(limit: int = 100, data_inicio: str = "") -> Dict[str, Any]:
-    """Lista vendas"""
-    vendas = vendas_db
-    
-    if data_inicio:
-        data_filtro = datetime.fromisoformat(data_inicio)
-        vendas = [v for v in vendas if datetime.fromisoformat(v['data_venda']) >= data_filtro]
-    
-    vendas = vendas[-limit:]  # Últimas vendas
+async def listar_vendas(limit: int = 100, data_inicio: str = "", after_id: Optional[int] = None) -> Dict[str, Any]:
+    """Lista vendas
+
+    Sem after_id retorna as últimas `limit` vendas. Com after_id retorna as
+    próximas `limit` vendas depois do cursor; a extração incremental repassa
+    o next_cursor da resposta como after_id da chamada seguinte.
+    """
+    data_filtro = datetime.fromisoformat(data_inicio) if data_inicio else None
+
+    # vendas_db e vendas_ts mudam juntas sob db_lock (registrar_venda): busca e fatia também
+    with db_lock:
+        if after_id is None:
+            inicio = max(0, len(vendas_db) - limit)  # Últimas vendas
+        else:
+            inicio = max(0, after_id)
+
+        if data_filtro:
+            inicio = max(inicio, bisect_left(vendas_ts, data_filtro.timestamp()))
+
+        if after_id is None:
+            vendas = vendas_db[inicio:]
+            next_cursor = inicio + len(vendas)
+        else:
+            vendas, next_cursor = pagina_apos(vendas_db, inicio, limit)
     
     return {
         "total": len(vendas),
         "dados": vendas,
+        "next_cursor": next_cursor,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -200,7 +259,7 @@ async def listar_clientes(limit: int = 100, vip_only: bool = False) -> Dict[str,
     clientes = clientes_ecommerce_db
     
     if vip_only:
-        clientes = [c for c in clientes if c['vip']]
+        clientes = clientes_vip_db
     
     clientes = clientes[:limit]
     
@@ -212,36 +271,49 @@ async def listar_clientes(limit: int = 100, vip_only: bool = False) -> Dict[str,
 
 @app.get("/stats")
 async def estatisticas() -> Dict[str, Any]:
-    """Estatísticas do e-commerce"""
-    total_vendas = len(vendas_db)
-    receita_total = sum(v['valor_total'] for v in vendas_db)
-    ticket_medio = receita_total / max(1, total_vendas)
-    
-    # Vendas por status
-    vendas_por_status = {}
-    for venda in vendas_db:
-        status = venda['status']
-        vendas_por_status[status] = vendas_por_status.get(status, 0) + 1
-    
-    # Top produtos
-    vendas_por_produto = {}
-    for venda in vendas_db:
-        produto_id = venda['produto_id']
-        vendas_por_produto[produto_id] = vendas_por_produto.get(produto_id, 0) + venda['quantidade']
+    """Estatísticas do e-commerce (agregados mantidos por registrar_venda)"""
+    with db_lock:
+        total_vendas = len(vendas_db)
+        receita = receita_total
+        por_status = dict(vendas_por_status)
+        # Top produtos por quantidade vendida (limitado ao catálogo, não ao histórico)
+        top_produtos = heapq.nlargest(5, vendas_por_produto.items(), key=lambda item: item[1])
+    
+    ticket_medio = receita / max(1, total_vendas)
     
     return {
         "resumo": {
             "total_vendas": total_vendas,
-            "receita_total": round(receita_total, 2),
+            "receita_total": round(receita, 2),
             "ticket_medio": round(ticket_medio, 2),
             "total_produtos": len(produtos_db),
             "total_clientes": len(clientes_ecommerce_db),
-            "clientes_vip": len([c for c in clientes_ecommerce_db if c['vip']])
+            "clientes_vip": len(clientes_vip_db)
         },
-        "vendas_por_status": vendas_por_status,
+        "vendas_por_status": por_status,
+        "top_produtos": [{"produto_id": produto_id, "quantidade": quantidade}
+                         for produto_id, quantidade in top_produtos],
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/export/{entidade}")
+async def exportar(entidade: str, after_id: int = 0, gzip: bool = False) -> StreamingResponse:
+    """Exporta produtos, vendas e clientes em NDJSON, em blocos (ver api_comum.exportar_ndjson)
+
+    ?gzip=true comprime o fluxo (Content-Encoding: gzip).
+    """
+    registros = {
+        "produtos": produtos_db,
+        "vendas": vendas_db,
+        "clientes": clientes_ecommerce_db,
+    }.get(entidade)
+    if registros is None:
+        raise HTTPException(status_code=404, detail=f"Entidade desconhecida: {entidade}")
+    
+    headers = {"Content-Encoding": "gzip"} if gzip else {}
+    return StreamingResponse(exportar_ndjson(registros, after_id, gzip),
+                             media_type="application/x-ndjson", headers=headers)
+
 if __name__ == "__main__":
     logger.info(" Iniciando API E-commerce na porta 8000...")
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -35,7 +35,11 @@ WHERE NOT EXISTS (
 DO $$
 BEGIN
   IF NOT EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'debezium_publication') THEN
-    EXECUTE 'CREATE PUBLICATION debezium_publication FOR TABLE clientes, pedidos, produtos, leads';
+    EXECUTE 'CREATE PUBLICATION debezium_publication FOR TABLE clientes, pedidos, produtos, leads, itens_pedido';
+  ELSIF NOT EXISTS (SELECT 1 FROM pg_publication_tables
+                    WHERE pubname = 'debezium_publication' AND tablename = 'itens_pedido') THEN
+    -- Publications criadas antes da replicação de itens_pedido
+    EXECUTE 'ALTER PUBLICATION debezium_publication ADD TABLE itens_pedido';
   END IF;
 END $$;
 PSQL
@@ -59,6 +63,7 @@ for i in $(seq 1 30); do
     echo "  dbserver1.public.pedidos"
     echo "  dbserver1.public.produtos"
     echo "  dbserver1.public.leads"
+    echo "  dbserver1.public.itens_pedido"
     exit 0
   fi
   sleep 3
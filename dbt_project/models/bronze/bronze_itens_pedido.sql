@@ -0,0 +1,28 @@
+-- models/bronze/bronze_itens_pedido.sql
+
+-- Seleciona todos os dados da tabela de itens de pedido da fonte
+-- Esta é uma visão simples dos dados brutos, sem transformações complexas ainda.
+
+{{ config(
+    materialized='view',
+    tags=['bronze', 'itens_pedido', 'cdc']
+) }}
+
+-- Bronze: Itens dos pedidos diretamente do source (replicados pelo consumer CDC,
+-- que grava o pedido antes dos seus itens em cada lote)
+SELECT 
+    id,
+    pedido_id,
+    produto_id,
+    quantidade,
+    preco_unitario,
+    desconto_item,
+    valor_total,
+    observacoes,
+    updated_at,
+    created_by,
+    version,
+    -- Metadados para auditoria CDC
+    updated_at as ultima_modificacao_fonte
+FROM {{ source('raw_data', 'itens_pedido') }}
+WHERE quantidade > 0  -- Validação básica: itens devem ter quantidade positiva
@@ -53,6 +53,25 @@ CREATE TABLE IF NOT EXISTS public.pedidos (
     version               INT
 );
 
+-- ─── Itens de Pedido ────────────────────────────────────────────────────────
+-- Sem FKs (como as demais tabelas): o consumer grava pedidos e produtos antes
+-- dos itens dentro de cada lote
+CREATE TABLE IF NOT EXISTS public.itens_pedido (
+    id             BIGINT PRIMARY KEY,
+    pedido_id      BIGINT,
+    produto_id     BIGINT,
+    quantidade     INT,
+    preco_unitario NUMERIC(15,2),
+    desconto_item  NUMERIC(15,2) DEFAULT 0,
+    valor_total    NUMERIC(15,2) GENERATED ALWAYS AS ((quantidade * preco_unitario) - desconto_item) STORED,
+    observacoes    TEXT,
+    updated_at     TIMESTAMP,
+    created_by     VARCHAR(100),
+    version        INT
+);
+
+CREATE INDEX IF NOT EXISTS idx_itens_pedido_pedido_id ON public.itens_pedido (pedido_id);
+
 -- ─── Leads ──────────────────────────────────────────────────────────────────
 CREATE TABLE IF NOT EXISTS public.leads (
     id                BIGINT PRIMARY KEY,
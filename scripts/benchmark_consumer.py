@@ -0,0 +1,612 @@
+#!/usr/bin/env python3
+"""
+Benchmark do consumer CDC sem a stack docker-compose
+Gera mensagens sintéticas no formato Debezium (dbserver1.public.*, transform
+unwrap), reproduz essas mensagens com um Consumer em processo e aplica os
+lotes num cursor que apenas registra os comandos ou num Postgres local.
+Para cada modo de processamento reporta eventos/s, latência p50/p99 de
+aplicação dos lotes e o pico de memória alocada (tracemalloc).
+
+Modos:
+    decode   decode + conversão de tipos (BatchBuffer), sem escrita
+    sync     loop inline do consumer (consume_inline / apply_batch)
+    workers  pool de workers (consume_with_workers)
+    async    variante asyncio (kafka_consumer_async); apenas com --target postgres
+
+Uso:
+    python3 benchmark_consumer.py --events 50000
+    python3 benchmark_consumer.py --target postgres --modes sync,workers,async
+    python3 benchmark_consumer.py --min-eps 20000 --json benchmark.json
+    python3 benchmark_consumer.py --format avro   # registry local em diretório temporário
+
+Com --target postgres o benchmark usa o banco BENCHMARK_DB (padrão
+db_benchmark) no servidor TARGET_*, criado se não existir e truncado a cada
+rodada — nunca o banco target do pipeline.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import kafka_consumer as kc
+
+logger = logging.getLogger("benchmark_consumer")
+
+BENCHMARK_DB = os.getenv("BENCHMARK_DB", "db_benchmark")
+SCHEMA_SQL   = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "postgres_target_init", "01_schemas.sql")
+
+MODES = ("decode", "sync", "workers", "async")
+
+# Proporção de eventos por topic (pedidos é o topic de maior volume)
+TOPIC_WEIGHTS = {
+    "dbserver1.public.clientes": 2,
+    "dbserver1.public.pedidos":  5,
+    "dbserver1.public.produtos": 1,
+    "dbserver1.public.leads":    2,
+}
+
+
+# ─── Gerador de mensagens Debezium ────────────────────────────────────────────
+
+def _synthetic_row(table: str, key: int, version: int, rng: random.Random) -> dict:
+    """Linha com os tipos do conector (decimal=double, time.precision=connect)."""
+    ts_ms = 1_700_000_000_000 + key * 1000 + version
+    days  = 19_000 + key % 500
+    if table == "public.clientes":
+        return {
+            "id": key, "nome": f"Cliente {key}", "email": f"cliente{key}@exemplo.com",
+            "telefone": f"(11) 9{key % 10000:04d}-{version % 10000:04d}", "cpf": f"{key:011d}",
+            "data_nascimento": 7_000 + key % 9_000, "status": rng.choice(("ATIVO", "INATIVO")),
+            "tipo_cliente": rng.choice(("PF", "PJ")), "limite_credito": round(rng.uniform(500, 50_000), 2),
+            "data_cadastro": ts_ms, "updated_at": ts_ms, "created_by": "gerador", "version": version,
+            "endereco": {"logradouro": f"Rua {key}", "cidade": "São Paulo", "uf": "SP", "cep": "01000-000"},
+        }
+    if table == "public.pedidos":
+        bruto, desconto = round(rng.uniform(10, 5_000), 2), round(rng.uniform(0, 10), 2)
+        return {
+            "id": key, "cliente_id": rng.randint(1, 10_000), "numero_pedido": f"PED-{key:08d}",
+            "data_pedido": ts_ms, "status": rng.choice(("PENDENTE", "PAGO", "ENVIADO", "ENTREGUE")),
+            "valor_bruto": bruto, "desconto": desconto,
+            # Coluna gerada: vem do source, mas não está no TABLE_MAP
+            "valor_liquido": round(bruto - desconto, 2),
+            "metodo_pagamento": rng.choice(("PIX", "CARTAO", "BOLETO")),
+            "canal_venda": rng.choice(("SITE", "APP", "LOJA")), "observacoes": None,
+            "data_entrega_prevista": days + 7, "data_entrega_real": None,
+            "updated_at": ts_ms, "created_by": "gerador", "version": version,
+        }
+    if table == "public.produtos":
+        return {
+            "id": key, "codigo_produto": f"PRD-{key:06d}", "nome": f"Produto {key}",
+            "categoria": rng.choice(("Eletrônicos", "Casa", "Moda", "Esportes")),
+            "preco_custo": round(rng.uniform(5, 500), 2), "preco_venda": round(rng.uniform(10, 900), 2),
+            "estoque_atual": rng.randint(0, 1_000), "ativo": True, "updated_at": ts_ms,
+        }
+    return {
+        "id": key, "nome": f"Lead {key}", "email": f"lead{key}@exemplo.com", "telefone": None,
+        "fonte": rng.choice(("GOOGLE", "INDICACAO", "EVENTO")), "score": rng.randint(0, 100),
+        "status": rng.choice(("NOVO", "QUALIFICADO", "CONVERTIDO")), "interesse": "PREMIUM",
+        "orcamento_estimado": round(rng.uniform(1_000, 100_000), 2), "data_contato": days,
+        "data_conversao": None, "updated_at": ts_ms,
+    }
+
+
+def _schema_for(topic: str, row: dict) -> dict:
+    # Representativo do envelope com schemas habilitados (só o tamanho importa)
+    return {
+        "type": "struct", "optional": False, "name": f"{topic}.Value",
+        "fields": [{"type": "string", "optional": True, "field": c} for c in row],
+    }
+
+
+_AVRO_META_FIELDS = [
+    {"name": "__op", "type": ["null", "string"], "default": None},
+    {"name": "__table", "type": ["null", "string"], "default": None},
+    {"name": "__lsn", "type": ["null", "long"], "default": None},
+    {"name": "__source_ts_ms", "type": ["null", "long"], "default": None},
+    {"name": "__deleted", "type": ["null", "string"], "default": None},
+]
+
+
+def _avro_schema_for(topic: str) -> dict:
+    """Schema Avro como o gerado pelo AvroConverter para o topic (após o unwrap)."""
+    cfg    = kc.TABLE_MAP[topic]
+    sample = _synthetic_row(cfg["table"], 1, 1, random.Random(0))
+    fields = []
+    for name, value in sample.items():
+        kind = cfg.get("types", {}).get(name)
+        if kind == "date":
+            avro_type = {"type": "int", "connect.name": "org.apache.kafka.connect.data.Date",
+                         "logicalType": "date"}
+        elif kind == "timestamp":
+            avro_type = {"type": "long", "connect.name": "org.apache.kafka.connect.data.Timestamp",
+                         "logicalType": "timestamp-millis"}
+        elif kind == "json" or isinstance(value, dict):
+            avro_type = {"type": "string", "connect.name": "io.debezium.data.Json"}
+        elif isinstance(value, bool):
+            avro_type = "boolean"
+        elif isinstance(value, int):
+            avro_type = "long"
+        elif isinstance(value, float):
+            avro_type = "double"
+        else:
+            avro_type = "string"
+        if name == cfg["pk"]:
+            fields.append({"name": name, "type": avro_type})
+        else:
+            fields.append({"name": name, "type": ["null", avro_type], "default": None})
+    return {"type": "record", "name": "Value", "namespace": topic,
+            "connect.name": f"{topic}.Value", "fields": fields + _AVRO_META_FIELDS}
+
+
+def _is_json_field(field: dict) -> bool:
+    types = field["type"] if isinstance(field["type"], list) else [field["type"]]
+    return any(isinstance(t, dict) and t.get("connect.name") == "io.debezium.data.Json" for t in types)
+
+
+class _AvroEncoder:
+    """Registra um schema por topic no registry local e serializa as mensagens."""
+
+    def __init__(self, registry):
+        import cdc_avro
+        self._cdc_avro = cdc_avro
+        self.registry  = registry
+        self._schemas  = {}  # topic → (schema id, schema parseado, colunas json)
+
+    def encode(self, topic: str, row: dict) -> bytes:
+        if topic not in self._schemas:
+            schema    = _avro_schema_for(topic)
+            schema_id = self.registry.register(schema)
+            parsed    = self._cdc_avro.fastavro.parse_schema(self._cdc_avro._strip_logical_types(schema))
+            json_cols = [f["name"] for f in schema["fields"] if _is_json_field(f)]
+            self._schemas[topic] = (schema_id, parsed, json_cols)
+        schema_id, parsed, json_cols = self._schemas[topic]
+        for col in json_cols:
+            if isinstance(row.get(col), dict):
+                row[col] = json.dumps(row[col], ensure_ascii=False)
+        return self._cdc_avro.encode(schema_id, parsed, row)
+
+
+class ReplayMessage:
+    """Mensagem com a mesma interface que o consumer usa de confluent_kafka.Message."""
+
+    __slots__ = ("_topic", "_partition", "_offset", "_value")
+
+    def __init__(self, topic: str, partition: int, offset: int, value: bytes):
+        self._topic, self._partition, self._offset, self._value = topic, partition, offset, value
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def value(self) -> bytes:
+        return self._value
+
+    def error(self):
+        return None
+
+
+def generate_messages(n_events: int, partitions: int = 1, snapshot_ratio: float = 0.2,
+                      update_ratio: float = 0.3, delete_ratio: float = 0.02,
+                      schemas: bool = False, seed: int = 42,
+                      avro_registry=None) -> list[ReplayMessage]:
+    """Sequência de mensagens CDC: snapshot (op=r) seguido de creates, updates e deletes.
+
+    Com `avro_registry` as mensagens são serializadas em Avro (wire format do
+    Schema Registry) e os schemas registrados nele; senão, em JSON.
+    """
+    rng      = random.Random(seed)
+    encoder  = _AvroEncoder(avro_registry) if avro_registry is not None else None
+    topics   = list(TOPIC_WEIGHTS)
+    weights  = list(TOPIC_WEIGHTS.values())
+    live     = {t: [] for t in topics}       # chaves existentes por topic
+    versions = {}
+    next_key = {t: 1 for t in topics}
+    offsets  = {}
+    messages = []
+
+    for i in range(n_events):
+        topic = rng.choices(topics, weights)[0]
+        table = kc.TABLE_MAP[topic]["table"]
+        roll  = rng.random()
+
+        if i < n_events * snapshot_ratio:
+            op = "r"
+        elif live[topic] and roll < delete_ratio:
+            op = "d"
+        elif live[topic] and roll < delete_ratio + update_ratio:
+            op = "u"
+        else:
+            op = "c"
+
+        if op in ("r", "c"):
+            key = next_key[topic]
+            next_key[topic] += 1
+            live[topic].append(key)
+        else:
+            key = rng.choice(live[topic])
+
+        version = versions[(topic, key)] = versions.get((topic, key), 0) + 1
+        row     = _synthetic_row(table, key, version, rng)
+        if op == "d":
+            # delete.handling.mode=rewrite: só a PK no before (REPLICA IDENTITY padrão)
+            live[topic].remove(key)
+            row = {c: (key if c == kc.TABLE_MAP[topic]["pk"] else None) for c in row}
+            row["__deleted"] = "true"
+
+        row["__op"], row["__table"] = op, table.split(".")[-1]
+        row["__lsn"], row["__source_ts_ms"] = 10_000 + i * 8, int(time.time() * 1000)
+        if encoder is not None:
+            value = encoder.encode(topic, row)
+        else:
+            body  = {"schema": _schema_for(topic, row), "payload": row} if schemas else row
+            value = json.dumps(body).encode()
+
+        partition = zlib.crc32(str(key).encode()) % partitions
+        offset    = offsets.get((topic, partition), 0)
+        offsets[(topic, partition)] = offset + 1
+        messages.append(ReplayMessage(topic, partition, offset, value))
+
+    return messages
+
+
+# ─── Consumer e target em processo ────────────────────────────────────────────
+
+class ReplayFinished(Exception):
+    """Todas as mensagens foram entregues e tiveram os offsets confirmados."""
+
+
+class ReplayConsumer:
+    """Stand-in do confluent_kafka.Consumer que reproduz uma lista de mensagens.
+
+    O replay termina (ReplayFinished no próximo consume) quando o consumer
+    confirma os offsets da última mensagem de todas as partições.
+    """
+
+    def __init__(self, messages: list[ReplayMessage]):
+        self.messages    = messages
+        self.position    = 0
+        self.end_offsets = {}
+        for m in messages:
+            self.end_offsets[(m.topic(), m.partition())] = m.offset() + 1
+        self.committed   = {}
+        self.finished_at = None
+        self._lock       = threading.Lock()
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> list[ReplayMessage]:
+        with self._lock:
+            if self.finished_at is not None:
+                raise ReplayFinished()
+            out = self.messages[self.position:self.position + num_messages]
+            self.position += len(out)
+        if not out and timeout and timeout > 0:
+            time.sleep(min(timeout, 0.001))
+        return out
+
+    def commit(self, offsets=None, asynchronous: bool = True) -> None:
+        with self._lock:
+            for tp in offsets or ():
+                key = (tp.topic, tp.partition)
+                self.committed[key] = max(self.committed.get(key, 0), tp.offset)
+            if self.finished_at is None and all(
+                self.committed.get(k, 0) >= end for k, end in self.end_offsets.items()
+            ):
+                self.finished_at = time.perf_counter()
+
+    def close(self) -> None:
+        pass
+
+
+class RecordingCursor:
+    """Cursor que apenas registra os comandos: isola o custo do lado Python."""
+
+    def __init__(self, connection: "RecordingConnection"):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def execute(self, sql, params=None) -> None:
+        self.connection.statements += 1
+        self.connection.bytes_sent += len(sql) + sum(len(str(p)) for p in params or ())
+
+    def mogrify(self, sql, params=None) -> bytes:
+        # Usado por psycopg2.extras.execute_values
+        return repr(params).encode()
+
+    def copy_expert(self, sql: str, file) -> None:
+        self.connection.statements += 1
+        self.connection.bytes_sent += len(file.read())
+
+    def fetchall(self) -> list:
+        return []
+
+
+class RecordingConnection:
+    encoding = "UTF8"
+
+    def __init__(self):
+        self.statements = 0
+        self.bytes_sent = 0
+
+    def cursor(self) -> RecordingCursor:
+        return RecordingCursor(self)
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+
+class RecordingPool:
+    """Mesmo contrato de TargetPool.run, com uma conexão de gravação por thread."""
+
+    def __init__(self):
+        self._local      = threading.local()
+        self.connections = []
+
+    def run(self, fn):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = RecordingConnection()
+            self.connections.append(conn)
+        return fn(conn)
+
+    def close(self) -> None:
+        pass
+
+
+# ─── Target Postgres dedicado ─────────────────────────────────────────────────
+
+def prepare_benchmark_db() -> None:
+    """Aponta o consumer para BENCHMARK_DB, criando banco e tabelas se preciso."""
+    admin = kc.get_db_conn()
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (BENCHMARK_DB,))
+        if cur.fetchone() is None:
+            cur.execute(f'CREATE DATABASE "{BENCHMARK_DB}"')
+            logger.info(f"Banco {BENCHMARK_DB} criado.")
+    admin.close()
+
+    kc.TARGET_DB = BENCHMARK_DB
+    conn = kc.get_db_conn()
+    with conn.cursor() as cur:
+        with open(SCHEMA_SQL) as f:
+            cur.execute(f.read())
+    conn.commit()
+    kc.ensure_target_schema(conn)
+    kc.refresh_table_map(conn)
+    conn.close()
+
+
+def reset_benchmark_db() -> None:
+    tables = [cfg["table"] for cfg in kc.TABLE_MAP.values()]
+    tables += ["public._pipeline_metadata", "public._pipeline_dlq"]
+    conn = kc.get_db_conn()
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(tables)}")
+    conn.commit()
+    conn.close()
+
+
+# ─── Execução dos modos ───────────────────────────────────────────────────────
+
+class _Timed:
+    """Substitui temporariamente module.name por uma versão cronometrada."""
+
+    def __init__(self, module, name: str, latencies: list):
+        self.module, self.name, self.latencies = module, name, latencies
+
+    def __enter__(self):
+        self.original = original = getattr(self.module, self.name)
+        latencies     = self.latencies
+
+        if asyncio.iscoroutinefunction(original):
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                result  = await original(*args, **kwargs)
+                latencies.append(time.perf_counter() - started)
+                return result
+        else:
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                result  = original(*args, **kwargs)
+                latencies.append(time.perf_counter() - started)
+                return result
+
+        setattr(self.module, self.name, timed)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        setattr(self.module, self.name, self.original)
+
+
+def _run_decode(messages: list, latencies: list) -> None:
+    for start in range(0, len(messages), kc.BATCH_SIZE):
+        started = time.perf_counter()
+        buffer  = kc.BatchBuffer()
+        for msg in messages[start:start + kc.BATCH_SIZE]:
+            buffer.add(msg)
+        latencies.append(time.perf_counter() - started)
+
+
+def _run_consumer(mode: str, consumer: ReplayConsumer, pool, workers: int, latencies: list) -> None:
+    try:
+        if mode == "sync":
+            with _Timed(kc, "apply_batch", latencies):
+                kc.consume_inline(consumer, pool)
+        elif mode == "workers":
+            with _Timed(kc, "apply_batch", latencies):
+                kc.consume_with_workers(consumer, pool, workers)
+        else:
+            import kafka_consumer_async as kca
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kafka")
+            try:
+                with _Timed(kca, "write_batch", latencies):
+                    asyncio.run(kca.run(consumer, executor, pool))
+            finally:
+                executor.shutdown()
+    except ReplayFinished:
+        pass
+
+
+def run_mode(mode: str, messages: list, target: str, workers: int) -> dict:
+    """Executa um modo sobre as mensagens e devolve as medições."""
+    latencies = []
+    pool      = None
+    consumer  = ReplayConsumer(messages)
+
+    if target == "postgres":
+        reset_benchmark_db()
+        if mode != "decode":
+            pool = kc.TargetPool(maxconn=workers + 1)
+    else:
+        pool = RecordingPool()
+
+    started = time.perf_counter()
+    try:
+        if mode == "decode":
+            _run_decode(messages, latencies)
+            finished = time.perf_counter()
+        else:
+            _run_consumer(mode, consumer, pool, workers, latencies)
+            finished = consumer.finished_at or time.perf_counter()
+    finally:
+        if pool is not None:
+            pool.close()
+
+    elapsed   = finished - started
+    latencies = sorted(latencies)
+    result    = {
+        "mode": mode, "target": target, "events": len(messages),
+        "seconds": round(elapsed, 4),
+        "events_per_sec": round(len(messages) / elapsed, 1) if elapsed else None,
+        "batches": len(latencies),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+    }
+    if isinstance(pool, RecordingPool):
+        result["statements"] = sum(c.statements for c in pool.connections)
+    return result
+
+
+def measure_allocations(mode: str, messages: list, target: str, workers: int) -> dict:
+    """Repete o modo sob tracemalloc (mais lento, por isso fora da rodada cronometrada)."""
+    tracemalloc.start()
+    try:
+        run_mode(mode, messages, target, workers)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"alloc_peak_kib": round(peak / 1024, 1), "alloc_retained_kib": round(current / 1024, 1)}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# ─── CLI ──────────────────────────────────────────────────────────────────────
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do consumer CDC com Kafka em processo")
+    parser.add_argument("--events", type=int, default=50_000, help="mensagens sintéticas (padrão: 50000)")
+    parser.add_argument("--modes", default="decode,sync,workers",
+                        help=f"modos separados por vírgula: {','.join(MODES)}")
+    parser.add_argument("--target", choices=("recording", "postgres"), default="recording",
+                        help="cursor que só registra comandos ou Postgres local (BENCHMARK_DB)")
+    parser.add_argument("--workers", type=int, default=4, help="workers do modo workers (padrão: 4)")
+    parser.add_argument("--partitions", type=int, default=1, help="partições por topic (padrão: 1)")
+    parser.add_argument("--batch-size", type=int, default=kc.BATCH_SIZE)
+    parser.add_argument("--linger-ms", type=int, default=kc.BATCH_LINGER_MS)
+    parser.add_argument("--format", choices=("json", "avro"), default="json",
+                        help="formato das mensagens (avro usa um registry local temporário)")
+    parser.add_argument("--schemas", action="store_true", help="envelope {schema, payload} nas mensagens JSON")
+    parser.add_argument("--no-alloc", action="store_true", help="não mede alocações (tracemalloc)")
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava os resultados em JSON")
+    parser.add_argument("--min-eps", type=float,
+                        help="retorna 1 se algum modo ficar abaixo deste número de eventos/s")
+    parser.add_argument("--verbose", action="store_true", help="mantém os logs do consumer")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"modo desconhecido: {mode}")
+    if "async" in modes and args.target != "postgres":
+        logger.warning("Modo async requer --target postgres (psycopg 3); ignorado.")
+        modes.remove("async")
+
+    if not args.verbose:
+        for name in ("kafka_consumer", "kafka_consumer_async", "cdc_metrics", "cdc_avro"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    kc.BATCH_SIZE      = args.batch_size
+    kc.BATCH_LINGER_MS = args.linger_ms
+    # Sem banco (recording) vale o TABLE_MAP estático
+    kc.TABLE_DISCOVERY = args.target == "postgres"
+    if args.target == "postgres":
+        prepare_benchmark_db()
+
+    registry = None
+    if args.format == "avro":
+        import cdc_avro
+        registry_dir     = tempfile.mkdtemp(prefix="cdc_registry_")
+        registry         = cdc_avro.FileSchemaRegistry(registry_dir)
+        kc._avro_decoder = kc.build_avro_decoder(f"file://{registry_dir}")
+
+    messages = generate_messages(args.events, partitions=args.partitions, schemas=args.schemas,
+                                 avro_registry=registry)
+    logger.info(f"{len(messages)} mensagens geradas ({sum(len(m.value()) for m in messages) / 1e6:.1f} MB) "
+                f"| lote {kc.BATCH_SIZE} / {kc.BATCH_LINGER_MS}ms | formato: {args.format} "
+                f"| JSON: {kc.JSON_BACKEND} | target: {args.target}")
+
+    results = []
+    for mode in modes:
+        result = run_mode(mode, messages, args.target, args.workers)
+        if not args.no_alloc:
+            result.update(measure_allocations(mode, messages, args.target, args.workers))
+        results.append(result)
+        logger.info(
+            f"{mode:<8} {result['events_per_sec']:>11,.0f} eventos/s | "
+            f"p50 {result['p50_ms']:.2f}ms p99 {result['p99_ms']:.2f}ms ({result['batches']} lotes)"
+            + (f" | pico {result['alloc_peak_kib']:,.0f} KiB" if "alloc_peak_kib" in result else "")
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"format": args.format, "json_backend": kc.JSON_BACKEND, "results": results}, f, indent=2)
+
+    if args.min_eps is not None:
+        slow = [r for r in results if r["events_per_sec"] < args.min_eps]
+        for r in slow:
+            logger.error(f"Regressão: modo {r['mode']} com {r['events_per_sec']:,.0f} eventos/s "
+                         f"(mínimo {args.min_eps:,.0f})")
+        if slow:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Decodificação Avro das mensagens Debezium (AvroConverter + Schema Registry).
+As mensagens chegam no wire format do Confluent: byte 0, schema id (4 bytes,
+big-endian) e o registro Avro binário. Cada schema é buscado uma única vez por
+id (Schema Registry HTTP ou diretório local com <id>.avsc) e cada par
+(schema id, topic) ganha um reader schema que projeta o registro direto nas
+colunas do TABLE_MAP, na ordem do mapeamento, mais os campos __ do unwrap.
+Os nomes de todos os campos do writer schema são repassados a
+`on_writer_fields` antes da projeção, para a detecção de colunas novas.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import urllib.error
+import urllib.request
+
+try:
+    import fastavro
+    from fastavro.read import SchemaResolutionError
+except ImportError:
+    import subprocess
+    import sys
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "fastavro", "-q"])
+    import fastavro
+    from fastavro.read import SchemaResolutionError
+
+logger = logging.getLogger("cdc_avro")
+
+MAGIC_BYTE = 0
+
+
+class AvroDecodeError(ValueError):
+    """Mensagem fora do wire format ou registro Avro inválido."""
+
+
+class SchemaRegistryError(RuntimeError):
+    """Schema id não encontrado ou registry indisponível.
+
+    `retryable` é False quando o schema não existe (HTTP 404, arquivo ausente
+    ou inválido): repetir a busca não adianta.
+    """
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+# ─── Registries ───────────────────────────────────────────────────────────────
+
+class HttpSchemaRegistry:
+    """Cliente mínimo do Schema Registry (GET /schemas/ids/{id})."""
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url     = url.rstrip("/")
+        self.timeout = timeout
+
+    def get_schema(self, schema_id: int) -> dict:
+        try:
+            with urllib.request.urlopen(f"{self.url}/schemas/ids/{schema_id}", timeout=self.timeout) as resp:
+                return json.loads(json.load(resp)["schema"])
+        except urllib.error.HTTPError as e:
+            raise SchemaRegistryError(f"Falha ao buscar schema {schema_id} em {self.url}: {e}",
+                                      retryable=e.code != 404) from e
+        except (OSError, ValueError, KeyError) as e:
+            raise SchemaRegistryError(f"Falha ao buscar schema {schema_id} em {self.url}: {e}") from e
+
+
+class FileSchemaRegistry:
+    """Stand-in local do Schema Registry: um arquivo <id>.avsc por schema."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def get_schema(self, schema_id: int) -> dict:
+        path = os.path.join(self.directory, f"{schema_id}.avsc")
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise SchemaRegistryError(f"Schema {schema_id} indisponível em {self.directory}: {e}",
+                                      retryable=not isinstance(e, (FileNotFoundError, ValueError))) from e
+
+    def register(self, schema: dict) -> int:
+        """Grava o schema com o próximo id livre e devolve o id."""
+        os.makedirs(self.directory, exist_ok=True)
+        ids = [int(name[:-5]) for name in os.listdir(self.directory)
+               if name.endswith(".avsc") and name[:-5].isdigit()]
+        schema_id = max(ids, default=0) + 1
+        with open(os.path.join(self.directory, f"{schema_id}.avsc"), "w") as f:
+            json.dump(schema, f)
+        return schema_id
+
+
+def registry_from_url(url: str):
+    """file:///caminho usa o registry local; qualquer outra URL, o Schema Registry HTTP."""
+    if url.startswith("file://"):
+        return FileSchemaRegistry(url[len("file://"):])
+    return HttpSchemaRegistry(url)
+
+
+# ─── Schemas ──────────────────────────────────────────────────────────────────
+
+def _strip_logical_types(schema):
+    # Datas e timestamps ficam como int/long, como no JsonConverter; a conversão
+    # continua a cargo de coerce_payload. "decimal" é mantido: sem ele o valor
+    # chegaria como bytes, e com ele o fastavro já devolve Decimal
+    if isinstance(schema, dict):
+        return {k: _strip_logical_types(v) for k, v in schema.items()
+                if k != "logicalType" or v == "decimal"}
+    if isinstance(schema, list):
+        return [_strip_logical_types(s) for s in schema]
+    return schema
+
+
+def reader_schema(writer: dict, columns: list) -> dict:
+    """Reader schema com as colunas mapeadas (na ordem de `columns`) e os campos __.
+
+    Campos do writer fora dessa lista são pulados pelo fastavro durante o
+    decode, sem serem materializados.
+    """
+    fields   = {f["name"]: f for f in writer["fields"]}
+    selected = [fields[c] for c in columns if c in fields]
+    selected += [f for name, f in fields.items() if name.startswith("__")]
+    return {**writer, "fields": selected}
+
+
+def encode(schema_id: int, parsed_schema, record: dict) -> bytes:
+    """Serializa um registro no wire format (usado pelo benchmark e em testes)."""
+    out = io.BytesIO()
+    out.write(bytes([MAGIC_BYTE]) + schema_id.to_bytes(4, "big"))
+    fastavro.schemaless_writer(out, parsed_schema, record)
+    return out.getvalue()
+
+
+# ─── Decoder ──────────────────────────────────────────────────────────────────
+
+class AvroDecoder:
+    """Decodifica mensagens Avro com cache de schemas por id e readers por topic.
+
+    `on_writer_fields(topic, campos)`, se informado, é chamado a cada novo par
+    (schema id, topic) com todos os campos do writer schema: o registro
+    decodificado só traz as colunas já mapeadas.
+    """
+
+    def __init__(self, registry, table_map: dict, on_writer_fields=None):
+        self.registry  = registry
+        self.table_map = table_map
+        self.on_writer_fields = on_writer_fields
+        self._writers: dict[int, dict] = {}
+        self._readers: dict[tuple, tuple] = {}  # (schema id, topic) → (writer, reader)
+        self._lock = threading.Lock()
+
+    def _schemas_for(self, schema_id: int, topic: str) -> tuple:
+        key     = (schema_id, topic)
+        schemas = self._readers.get(key)
+        if schemas is not None:
+            return schemas
+
+        with self._lock:
+            if schema_id not in self._writers:
+                self._writers[schema_id] = _strip_logical_types(self.registry.get_schema(schema_id))
+                logger.info(f"Schema {schema_id} carregado ({topic})")
+            writer = self._writers[schema_id]
+            cfg    = self.table_map.get(topic)
+            if cfg and writer.get("type") == "record":
+                schemas = (fastavro.parse_schema(writer),
+                           fastavro.parse_schema(reader_schema(writer, cfg["columns"])))
+            else:
+                schemas = (fastavro.parse_schema(writer), None)
+            self._readers[key] = schemas
+        if self.on_writer_fields is not None and writer.get("type") == "record":
+            self.on_writer_fields(topic, [f["name"] for f in writer["fields"]])
+        return schemas
+
+    def decode(self, topic: str, value: bytes):
+        """Decodifica o valor de uma mensagem do topic para um dict."""
+        if len(value) < 5 or value[0] != MAGIC_BYTE:
+            raise AvroDecodeError("mensagem fora do wire format do Schema Registry")
+        writer, reader = self._schemas_for(int.from_bytes(value[1:5], "big"), topic)
+        try:
+            return fastavro.schemaless_reader(io.BytesIO(value[5:]), writer, reader)
+        except (EOFError, ValueError, IndexError, UnicodeDecodeError, SchemaResolutionError) as e:
+            raise AvroDecodeError(f"registro Avro inválido: {e}") from e
+
+    def reset(self) -> None:
+        """Descarta os readers (ex.: após mudança de TABLE_MAP)."""
+        with self._lock:
+            self._readers.clear()
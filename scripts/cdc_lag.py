@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Monitor de lag do consumer CDC
+Calcula o lag por partição a partir do Kafka (high watermark menos o offset
+confirmado pelo grupo) e o lag em tempo a partir do __source_ts_ms do último
+evento aplicado, sem nenhuma consulta ao banco. Os valores são publicados
+como gauges no /metrics do consumer; o dashboard e o modo CLI leem de lá.
+
+Uso:
+    python3 cdc_lag.py                                   # lag atual do consumer
+    python3 cdc_lag.py --metrics-url http://host:9108/metrics
+"""
+
+import argparse
+import logging
+import re
+import threading
+import time
+import urllib.request
+
+import cdc_metrics as metrics
+
+logger = logging.getLogger("cdc_lag")
+
+_SAMPLE_RE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+_LABEL_RE  = re.compile(r'(\w+)="([^"]*)"')
+
+
+class LagMonitor(threading.Thread):
+    """Thread que atualiza os gauges de lag a cada `interval` segundos.
+
+    Usa um consumer próprio, sem subscribe (não entra no grupo nem dispara
+    rebalance), apenas para ler watermarks e os offsets confirmados do grupo.
+    `topics()` devolve os topics a medir e `source_ts` é o dict
+    (topic, partição) → __source_ts_ms do último evento aplicado, mantido pelo
+    consumer. Se uma medição falha, os gauges de lag são limpos e
+    cdc_lag_monitor_up vai a 0, em vez de ficarem com o último valor.
+    """
+
+    def __init__(self, config: dict, topics, source_ts: dict, interval: float):
+        super().__init__(name="cdc-lag", daemon=True)
+        self.config    = config
+        self.topics    = topics
+        self.source_ts = source_ts
+        self.interval  = interval
+        self.stopping  = threading.Event()
+
+    def run(self) -> None:
+        from confluent_kafka import Consumer
+
+        consumer = None
+        try:
+            while not self.stopping.is_set():
+                try:
+                    if consumer is None:
+                        consumer = Consumer(self.config)
+                    self.measure(consumer)
+                    metrics.LAG_MONITOR_UP.set(1)
+                except Exception as e:
+                    logger.warning(f"Falha ao medir o lag: {e}")
+                    self.clear_gauges()
+                self.stopping.wait(self.interval)
+        finally:
+            self.clear_gauges()
+            if consumer is not None:
+                consumer.close()
+
+    def stop(self, timeout: float = 15) -> None:
+        """Encerra o monitor e aguarda a thread (uma medição em curso termina antes)."""
+        self.stopping.set()
+        self.join(timeout)
+
+    @staticmethod
+    def clear_gauges() -> None:
+        metrics.CONSUMER_LAG.clear()
+        metrics.CONSUMER_LAG_SECONDS.clear()
+        metrics.LAG_MONITOR_UP.set(0)
+
+    def measure(self, consumer) -> dict[tuple, tuple]:
+        """Atualiza os gauges e devolve (topic, partição) → (lag em mensagens, lag em segundos)."""
+        from confluent_kafka import TopicPartition
+
+        partitions = []
+        for topic in self.topics():
+            meta = consumer.list_topics(topic, timeout=10).topics.get(topic)
+            if meta is not None and meta.error is None:
+                partitions += [TopicPartition(topic, p) for p in sorted(meta.partitions)]
+        if not partitions:
+            return {}
+
+        now_ms = time.time() * 1000
+        lag    = {}
+        for tp in consumer.committed(partitions, timeout=10):
+            low, high = consumer.get_watermark_offsets(tp, timeout=10)
+            # Sem offset confirmado o grupo começa do início (auto.offset.reset=earliest)
+            messages = max(0, high - (tp.offset if tp.offset >= 0 else low))
+            source_ts = self.source_ts.get((tp.topic, tp.partition))
+            if messages == 0:
+                seconds = 0.0
+            elif source_ts:
+                seconds = max(0.0, (now_ms - source_ts) / 1000)
+            else:
+                seconds = None
+
+            labels = (tp.topic, str(tp.partition))
+            metrics.CONSUMER_LAG.set(messages, *labels)
+            if seconds is not None:
+                metrics.CONSUMER_LAG_SECONDS.set(seconds, *labels)
+            lag[(tp.topic, tp.partition)] = (messages, seconds)
+        return lag
+
+
+def start_lag_monitor(config: dict, topics, source_ts: dict, interval: float) -> LagMonitor | None:
+    """Sobe o monitor de lag. Intervalo 0 desabilita."""
+    if not interval:
+        return None
+    monitor = LagMonitor(config, topics, source_ts, interval)
+    monitor.start()
+    logger.info(f"Monitor de lag a cada {interval}s")
+    return monitor
+
+
+def read_lag(metrics_url: str, timeout: float = 2) -> list[dict]:
+    """Lê os gauges de lag do /metrics do consumer.
+
+    Retorna [{topic, partition, lag_messages, lag_seconds}] ordenado por topic
+    e partição; lag_seconds é None enquanto não há evento aplicado na partição.
+    """
+    with urllib.request.urlopen(metrics_url, timeout=timeout) as resp:
+        text = resp.read().decode("utf-8")
+
+    rows = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match or match.group(1) not in ("cdc_consumer_lag_messages", "cdc_consumer_lag_seconds"):
+            continue
+        labels = dict(_LABEL_RE.findall(match.group(2)))
+        key    = (labels.get("topic", ""), int(labels.get("partition", 0)))
+        row    = rows.setdefault(key, {"topic": key[0], "partition": key[1],
+                                       "lag_messages": 0, "lag_seconds": None})
+        if match.group(1) == "cdc_consumer_lag_messages":
+            row["lag_messages"] = int(float(match.group(3)))
+        else:
+            row["lag_seconds"] = float(match.group(3))
+    return [rows[key] for key in sorted(rows)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Lag do consumer CDC por partição")
+    parser.add_argument("--metrics-url", default="http://localhost:9108/metrics",
+                        help="endpoint /metrics do consumer (padrão: http://localhost:9108/metrics)")
+    args = parser.parse_args()
+
+    rows = read_lag(args.metrics_url)
+    if not rows:
+        print("Nenhum lag publicado (monitor desabilitado, com falha ou primeira medição pendente).")
+        return
+    for row in rows:
+        seconds = "-" if row["lag_seconds"] is None else f"{row['lag_seconds']:.1f}s"
+        print(f"{row['topic']}[{row['partition']}]: {row['lag_messages']} mensagens | {seconds}")
+    print(f"Total: {sum(r['lag_messages'] for r in rows)} mensagens")
+
+
+if __name__ == "__main__":
+    main()
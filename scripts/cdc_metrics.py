@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Métricas do consumer CDC no formato texto do Prometheus.
+Contadores e histogramas thread-safe em memória, expostos por um servidor
+HTTP leve (stdlib) em /metrics.
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("cdc_metrics")
+
+# Buckets padrão (segundos) para latências de decode/coerce até commit
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01,
+                   0.05, 0.1, 0.5, 1.0, 5.0)
+LAG_BUCKETS     = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SIZE_BUCKETS    = (1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _labels_str(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Contador monotônico com labels."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_str(self.labels, values)} {v}")
+        return lines
+
+
+class Gauge:
+    """Valor instantâneo com labels."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def clear(self) -> None:
+        """Remove todas as séries (valores que deixaram de ser confiáveis)."""
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for values, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_str(self.labels, values)} {v}")
+        return lines
+
+
+class Histogram:
+    """Histograma cumulativo com buckets fixos e labels."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}  # labels → [contagens por bucket, soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total_sum, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le = _labels_str(self.labels, values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels_str(self.labels, values)} {total_sum}")
+                lines.append(f"{self.name}_count{_labels_str(self.labels, values)} {total}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+EVENTS = REGISTRY.register(Counter(
+    "cdc_events_total", "Eventos CDC aplicados no target (use rate() para eventos/s)", ("topic",)))
+DEAD_LETTERS = REGISTRY.register(Counter(
+    "cdc_dead_letters_total", "Eventos inválidos enviados para _pipeline_dlq", ("topic",)))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "cdc_batch_size", "Eventos por lote gravado", SIZE_BUCKETS))
+DECODE_SECONDS = REGISTRY.register(Histogram(
+    "cdc_decode_seconds", "Tempo de decode JSON por mensagem", LATENCY_BUCKETS))
+COERCE_SECONDS = REGISTRY.register(Histogram(
+    "cdc_coerce_seconds", "Tempo de conversão de tipos por mensagem", LATENCY_BUCKETS))
+DB_WRITE_SECONDS = REGISTRY.register(Histogram(
+    "cdc_db_write_seconds", "Tempo de escrita do lote no target (antes do commit)", LATENCY_BUCKETS))
+COMMIT_SECONDS = REGISTRY.register(Histogram(
+    "cdc_commit_seconds", "Tempo do commit do lote no target", LATENCY_BUCKETS))
+CONSUMER_LAG = REGISTRY.register(Gauge(
+    "cdc_consumer_lag_messages", "Mensagens entre o high watermark e o offset confirmado",
+    ("topic", "partition")))
+CONSUMER_LAG_SECONDS = REGISTRY.register(Gauge(
+    "cdc_consumer_lag_seconds", "Idade (__source_ts_ms) do último evento aplicado, se há lag",
+    ("topic", "partition")))
+LAG_MONITOR_UP = REGISTRY.register(Gauge(
+    "cdc_lag_monitor_up", "1 se a última medição de lag funcionou; 0 em falha (gauges de lag limpos)"))
+PENDING_TRANSACTIONS = REGISTRY.register(Gauge(
+    "cdc_pending_transactions", "Transações do source retidas aguardando eventos (TRANSACTION_BATCHING)"))
+END_TO_END_LAG = REGISTRY.register(Histogram(
+    "cdc_end_to_end_lag_seconds", "Atraso entre __source_ts_ms e a aplicação no target",
+    LAG_BUCKETS, ("topic",)))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass  # evita um log por scrape
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer | None:
+    """Sobe o endpoint /metrics em uma thread daemon. Porta 0 desabilita."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="cdc-metrics", daemon=True).start()
+    logger.info(f"Métricas Prometheus em http://0.0.0.0:{port}/metrics")
+    return server
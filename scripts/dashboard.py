@@ -11,6 +11,8 @@ import plotly.express as px
 from datetime import datetime
 import time
 
+from cdc_lag import read_lag
+
 st.set_page_config(
     page_title="Kafka + dbt Pipeline — Dashboard",
     page_icon="⚡",
@@ -28,6 +30,8 @@ st.markdown("""
 
 DB_SOURCE = dict(host='localhost', port=5430, database='db_source', user='admin', password='admin')
 DB_TARGET = dict(host='localhost', port=5431, database='db_target', user='admin', password='admin')
+# Endpoint Prometheus do kafka_consumer (lag medido no Kafka, sem consultas ao banco)
+METRICS_URL = 'http://localhost:9108/metrics'
 
 
 @st.cache_data(ttl=3)
@@ -39,6 +43,14 @@ def query(sql, cfg=None):
         return pd.DataFrame({"Erro": [str(e)]})
 
 
+@st.cache_data(ttl=3)
+def consumer_lag():
+    try:
+        return pd.DataFrame(read_lag(METRICS_URL))
+    except Exception as e:
+        return pd.DataFrame({"Erro": [str(e)]})
+
+
 # ── Header ────────────────────────────────────────────────────────────────────
 st.title("⚡ Kafka + dbt — Dashboard em Tempo Real")
 st.caption(f"Atualizado: {datetime.now().strftime('%H:%M:%S')} | CDC: PostgreSQL → Debezium → Kafka → Consumer → dbt")
@@ -58,7 +70,10 @@ with st.sidebar:
 
     st.divider()
     st.subheader("🔧 Kafka Consumer")
-    kafka_meta = query("SELECT topic, event_count, last_event FROM public._pipeline_metadata ORDER BY event_count DESC")
+    kafka_meta = query("""
+        SELECT topic, SUM(event_count) AS event_count, MAX(last_event) AS last_event
+        FROM public._pipeline_metadata GROUP BY topic ORDER BY event_count DESC
+    """)
     if 'Erro' not in kafka_meta.columns and not kafka_meta.empty:
         st.dataframe(kafka_meta, hide_index=True, use_container_width=True)
     else:
@@ -94,36 +109,42 @@ with col4:
 st.divider()
 
 # ── Lag Kafka ──────────────────────────────────────────────────────────────────
-st.header("⚡ Lag Kafka (Source vs Target)")
-lag_c = n_sc - n_tc
-lag_p = n_sp - n_tp
+st.header("⚡ Lag Kafka (High Watermark vs Offset Confirmado)")
+lag_df = consumer_lag()
 
 col_chart, col_lag = st.columns([2, 1])
-with col_chart:
-    lag_df = pd.DataFrame({
-        "Tabela": ["clientes", "pedidos"],
-        "Source": [n_sc, n_sp],
-        "Target (Kafka)": [n_tc, n_tp],
-    })
-    fig = px.bar(
-        lag_df.melt(id_vars="Tabela", var_name="Camada", value_name="Registros"),
-        x="Tabela", y="Registros", color="Camada", barmode="group",
-        color_discrete_map={"Source": "#00d4ff", "Target (Kafka)": "#00ff9d"},
-        title="Registros por Camada"
-    )
-    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(14,28,54,0.8)',
-                      font_color='white', title_font_color='white')
-    st.plotly_chart(fig, use_container_width=True)
-
-with col_lag:
-    st.metric("Lag clientes", f"{lag_c:+d} rows", delta_color="inverse")
-    st.metric("Lag pedidos",  f"{lag_p:+d} rows", delta_color="inverse")
-    if lag_c == 0 and lag_p == 0:
-        st.success("⚡ Kafka em dia!")
-    elif lag_c + lag_p < 10:
-        st.info(f"⏳ {lag_c + lag_p} rows replicando...")
-    else:
-        st.warning(f"🔄 {lag_c + lag_p} rows na fila Kafka")
+if 'Erro' in lag_df.columns:
+    with col_chart:
+        st.warning(f"Métricas do consumer indisponíveis em {METRICS_URL}: {lag_df['Erro'].iloc[0][:60]}")
+elif lag_df.empty:
+    with col_chart:
+        st.info("Aguardando a primeira medição de lag do consumer...")
+else:
+    lag_df["Tabela"] = lag_df["topic"].str.split(".").str[-1]
+    total_lag   = int(lag_df["lag_messages"].sum())
+    max_seconds = lag_df["lag_seconds"].max()
+    with col_chart:
+        by_table = lag_df.groupby("Tabela", as_index=False)["lag_messages"].sum()
+        fig = px.bar(
+            by_table, x="Tabela", y="lag_messages",
+            color_discrete_sequence=["#00d4ff"],
+            labels={"lag_messages": "Mensagens pendentes"},
+            title="Lag por Tabela (mensagens)"
+        )
+        fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(14,28,54,0.8)',
+                          font_color='white', title_font_color='white')
+        st.plotly_chart(fig, use_container_width=True)
+
+    with col_lag:
+        st.metric("Lag total", f"{total_lag} msgs", delta_color="inverse")
+        st.metric("Lag em tempo", "-" if pd.isna(max_seconds) else f"{max_seconds:.1f}s",
+                  delta_color="inverse")
+        if total_lag == 0:
+            st.success("⚡ Kafka em dia!")
+        elif total_lag < 10:
+            st.info(f"⏳ {total_lag} mensagens replicando...")
+        else:
+            st.warning(f"🔄 {total_lag} mensagens na fila Kafka")
 
 st.divider()
 
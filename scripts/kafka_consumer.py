@@ -6,20 +6,44 @@ Roda como um serviço contínuo.
 """
 
 import os
+import io
+import hashlib
 import json
 import logging
+import queue
+import random
+import re
+import signal
+import threading
 import time
+import weakref
+import zlib
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
+import psycopg2.pool
 from datetime import datetime
 
+import cdc_metrics as metrics
+
 try:
-    from confluent_kafka import Consumer, KafkaError, KafkaException
+    from confluent_kafka import Consumer, KafkaError, KafkaException, TopicPartition
 except ImportError:
     import subprocess
     import sys
     subprocess.check_call([sys.executable, "-m", "pip", "install", "confluent-kafka", "-q"])
-    from confluent_kafka import Consumer, KafkaError, KafkaException
+    from confluent_kafka import Consumer, KafkaError, KafkaException, TopicPartition
+
+# Decodificadores JSON opcionais (mais rápidos que o json da stdlib)
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -36,14 +60,72 @@ TARGET_DB       = os.getenv("TARGET_DB", "db_target")
 TARGET_USER     = os.getenv("TARGET_USER", "admin")
 TARGET_PASSWORD = os.getenv("TARGET_PASSWORD", "admin")
 
+# Micro-batching: acumula até BATCH_SIZE eventos ou BATCH_LINGER_MS de espera
+# antes de gravar o lote com um INSERT multi-row e um único commit.
+BATCH_SIZE      = int(os.getenv("BATCH_SIZE", "500"))
+BATCH_LINGER_MS = int(os.getenv("BATCH_LINGER_MS", "200"))
+
+# Pool de workers: com CONSUMER_WORKERS > 1 cada worker tem sua própria conexão
+# e recebe as partições roteadas a ele (ordem por chave preservada).
+CONSUMER_WORKERS   = int(os.getenv("CONSUMER_WORKERS", "1"))
+WORKER_QUEUE_SIZE  = int(os.getenv("WORKER_QUEUE_SIZE", "8"))
+# Opcional: roteia tabelas relacionadas (TABLE_PARENTS/FKs) para o mesmo worker,
+# para pai e filhos caírem no mesmo lote. No schema de e-commerce isso junta
+# clientes, pedidos, produtos e itens_pedido num worker só e serializa a carga.
+WORKER_TABLE_GROUPS = os.getenv("WORKER_TABLE_GROUPS", "false").lower() == "true"
+
+# Reconexão ao target: backoff exponencial com jitter e health check das
+# conexões do pool que ficaram ociosas por mais de POOL_HEALTHCHECK_SECONDS
+RECONNECT_BASE_DELAY_MS  = int(os.getenv("RECONNECT_BASE_DELAY_MS", "200"))
+RECONNECT_MAX_DELAY_MS   = int(os.getenv("RECONNECT_MAX_DELAY_MS", "30000"))
+RECONNECT_MAX_ATTEMPTS   = int(os.getenv("RECONNECT_MAX_ATTEMPTS", "0"))  # 0 = sem limite
+POOL_HEALTHCHECK_SECONDS = int(os.getenv("POOL_HEALTHCHECK_SECONDS", "30"))
+
+# Endpoint Prometheus (/metrics); 0 desabilita
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Lag por partição (high watermark − offset confirmado) medido no Kafka a cada
+# LAG_INTERVAL_SECONDS e publicado no /metrics (ver cdc_lag.py); 0 desabilita
+LAG_INTERVAL_SECONDS = float(os.getenv("LAG_INTERVAL_SECONDS", "15"))
+
+# Formato das mensagens: "json" (JsonConverter) ou "avro" (AvroConverter com
+# Schema Registry; file:///caminho usa um registry local, ver cdc_avro.py)
+VALUE_FORMAT        = os.getenv("VALUE_FORMAT", "json")
+SCHEMA_REGISTRY_URL = os.getenv("SCHEMA_REGISTRY_URL", "http://schema-registry:8081")
+
+# Eventos de snapshot (op=r) em grupos a partir deste tamanho vão por COPY
+# para uma tabela de staging e são mesclados com um único INSERT ... SELECT.
+SNAPSHOT_COPY_MIN_ROWS = int(os.getenv("SNAPSHOT_COPY_MIN_ROWS", "200"))
+
+# Descoberta das tabelas: o mapeamento topic → tabela é montado a partir do
+# catálogo do target (colunas, tipos e PK) e o consumer assina os topics por
+# regex. Com TABLE_DISCOVERY=false vale o TABLE_MAP estático abaixo.
+TABLE_DISCOVERY        = os.getenv("TABLE_DISCOVERY", "true").lower() == "true"
+TOPIC_PREFIX           = os.getenv("TOPIC_PREFIX", "dbserver1")
+TARGET_SCHEMA          = os.getenv("TARGET_SCHEMA", "public")
+TOPIC_PATTERN          = os.getenv("TOPIC_PATTERN", rf"^{TOPIC_PREFIX}\.{TARGET_SCHEMA}\..*")
+SCHEMA_REFRESH_SECONDS = int(os.getenv("SCHEMA_REFRESH_SECONDS", "30"))
+
+# Lotes por transação do source (requer provide.transaction.metadata e
+# transaction.id no unwrap): os eventos de uma transação só são gravados com a
+# transação completa, na ordem de commit do source, e várias transações pequenas
+# vão no mesmo commit. Transações incompletas após TRANSACTION_TIMEOUT_MS são
+# gravadas assim mesmo.
+TRANSACTION_BATCHING   = os.getenv("TRANSACTION_BATCHING", "false").lower() == "true"
+TRANSACTION_TOPIC      = os.getenv("TRANSACTION_TOPIC", f"{TOPIC_PREFIX}.transaction")
+TRANSACTION_TIMEOUT_MS = int(os.getenv("TRANSACTION_TIMEOUT_MS", "10000"))
+
 TOPICS = [
     "dbserver1.public.clientes",
     "dbserver1.public.pedidos",
     "dbserver1.public.produtos",
     "dbserver1.public.leads",
+    "dbserver1.public.itens_pedido",
 ]
 
-# Mapeamento topic → tabela destino e colunas para UPSERT
+# Mapeamento topic → tabela destino, colunas para UPSERT e tipos que exigem
+# conversão do formato Debezium ("date", "timestamp" ou "json"). Substituído
+# em tempo de execução por refresh_table_map quando TABLE_DISCOVERY está ativo.
 TABLE_MAP = {
     "dbserver1.public.clientes": {
         "table": "public.clientes",
@@ -53,6 +135,10 @@ TABLE_MAP = {
             "status", "tipo_cliente", "limite_credito", "data_cadastro",
             "updated_at", "created_by", "version", "endereco",
         ],
+        "types": {
+            "data_nascimento": "date", "data_cadastro": "timestamp",
+            "updated_at": "timestamp",
+        },
     },
     "dbserver1.public.pedidos": {
         "table": "public.pedidos",
@@ -63,6 +149,10 @@ TABLE_MAP = {
             "canal_venda", "observacoes", "data_entrega_prevista",
             "data_entrega_real", "updated_at", "created_by", "version",
         ],
+        "types": {
+            "data_pedido": "timestamp", "data_entrega_prevista": "date",
+            "data_entrega_real": "date", "updated_at": "timestamp",
+        },
     },
     "dbserver1.public.produtos": {
         "table": "public.produtos",
@@ -71,6 +161,7 @@ TABLE_MAP = {
             "id", "codigo_produto", "nome", "categoria", "preco_custo",
             "preco_venda", "estoque_atual", "ativo", "updated_at",
         ],
+        "types": {"updated_at": "timestamp"},
     },
     "dbserver1.public.leads": {
         "table": "public.leads",
@@ -80,9 +171,31 @@ TABLE_MAP = {
             "status", "interesse", "orcamento_estimado", "data_contato",
             "data_conversao", "updated_at",
         ],
+        "types": {
+            "data_contato": "date", "data_conversao": "date",
+            "updated_at": "timestamp",
+        },
+    },
+    "dbserver1.public.itens_pedido": {
+        "table": "public.itens_pedido",
+        "pk": "id",
+        "columns": [
+            "id", "pedido_id", "produto_id", "quantidade", "preco_unitario",
+            "desconto_item", "observacoes", "updated_at", "created_by", "version",
+        ],
+        "types": {"updated_at": "timestamp"},
     },
 }
 
+# Hierarquia entre tabelas (filha → pais), somada às FKs encontradas no
+# catálogo do target. Dentro de um lote os pais são gravados antes dos filhos
+# (deletes na ordem inversa); com WORKER_TABLE_GROUPS, tabelas relacionadas
+# também são roteadas para o mesmo worker.
+TABLE_PARENTS = {
+    "public.pedidos":      ("public.clientes",),
+    "public.itens_pedido": ("public.pedidos", "public.produtos"),
+}
+
 
 # ─── Utilitários ──────────────────────────────────────────────────────────────
 
@@ -94,107 +207,1418 @@ def get_db_conn():
     )
 
 
+def backoff_delay(attempt: int) -> float:
+    """Espera (s) antes da tentativa `attempt`: exponencial, limitada, com jitter."""
+    delay = min(RECONNECT_MAX_DELAY_MS, RECONNECT_BASE_DELAY_MS * 2 ** attempt) / 1000
+    return random.uniform(delay / 2, delay)
+
+
+# SQLSTATE de conexão perdida: classe 08 e 57P (servidor encerrando ou indisponível)
+_CONNECTION_SQLSTATES = ("08", "57P")
+
+
+def connection_lost(e: BaseException, conn=None) -> bool:
+    """Indica se o erro `e` significa que a conexão com o target caiu.
+
+    Só esses erros justificam descartar a conexão e repetir o lote; os demais
+    OperationalError (limites do servidor, statement cancelado etc.) são do
+    próprio comando e seguem para o isolamento/DLQ.
+    """
+    if isinstance(e, psycopg2.InterfaceError) or (conn is not None and conn.closed):
+        return True
+    if not isinstance(e, psycopg2.OperationalError):
+        return False
+    if type(e) is psycopg2.OperationalError and not e.pgcode:
+        return True  # erro do libpq, sem SQLSTATE: conexão recusada ou interrompida
+    return (e.pgcode or "").startswith(_CONNECTION_SQLSTATES)
+
+
+class TargetPool:
+    """Pool de conexões com o target, com health check e reconexão com backoff.
+
+    `run(fn)` executa fn(conn) numa conexão do pool; se a conexão caiu (ver
+    connection_lost) ela é descartada e fn é reexecutada (com o mesmo lote)
+    numa nova, até o target voltar ou RECONNECT_MAX_ATTEMPTS se esgotar.
+    Erros do próprio comando devolvem a conexão ao pool e sobem para o chamador.
+    """
+
+    def __init__(self, maxconn: int):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            0, maxconn,
+            host=TARGET_HOST, port=TARGET_PORT, dbname=TARGET_DB,
+            user=TARGET_USER, password=TARGET_PASSWORD
+        )
+        self._last_used: dict[int, float] = {}
+
+    def _healthy(self, conn) -> bool:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn) -> None:
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def _checkout(self):
+        conn = self._pool.getconn()
+        idle = time.time() - self._last_used.get(id(conn), 0)
+        if conn.closed or (idle > POOL_HEALTHCHECK_SECONDS and not self._healthy(conn)):
+            self._discard(conn)
+            conn = self._pool.getconn()
+        return conn
+
+    def _release(self, conn) -> None:
+        if not conn.closed:
+            conn.rollback()  # nunca devolve uma transação aberta ao pool
+        self._last_used[id(conn)] = time.time()
+        self._pool.putconn(conn)
+
+    def run(self, fn):
+        attempt = 0
+        while True:
+            conn = None
+            try:
+                conn = self._checkout()
+                result = fn(conn)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if not connection_lost(e, conn):
+                    if conn is not None:
+                        self._release(conn)
+                    raise
+                if conn is not None:
+                    self._discard(conn)
+                if RECONNECT_MAX_ATTEMPTS and attempt + 1 >= RECONNECT_MAX_ATTEMPTS:
+                    raise
+                delay = backoff_delay(attempt)
+                attempt += 1
+                logger.warning(f"Falha de conexão com o target ({str(e).strip()}); "
+                               f"tentativa {attempt} em {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                if conn is not None:
+                    self._release(conn)
+                raise
+            self._release(conn)
+            if attempt:
+                logger.info("Conexão com o target restabelecida.")
+            return result
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
 from datetime import date, timedelta as tdelta, datetime as dt
 
 # Debezium date handling
 EPOCH = date(1970, 1, 1)
 
-# Columns that Debezium sends as epoch days (DATE fields)
-DATE_COLS = {"data_nascimento", "data_cadastro_date", "data_contato", "data_conversao",
-             "data_entrega_prevista", "data_entrega_real"}
-
-# Columns that Debezium sends as epoch milliseconds (TIMESTAMP fields)
-TS_COLS = {"data_cadastro", "data_pedido", "updated_at", "data_nascimento_ts"}
-
-# Columns that hold JSON strings (stored as TEXT in target)
-JSON_COLS = {"endereco"}
-
-
-def coerce_payload(payload: dict) -> dict:
-    """Convert Debezium wire types to Python / PostgreSQL compatible types."""
-    result = {}
-    for k, v in payload.items():
-        if v is None:
-            result[k] = None
-        elif k in DATE_COLS and isinstance(v, (int, float)):
-            # Debezium DATE = days since epoch
-            result[k] = (EPOCH + tdelta(days=int(v))).isoformat()
-        elif k in TS_COLS and isinstance(v, (int, float)):
-            # Debezium TIMESTAMP = microseconds since epoch
-            result[k] = dt.utcfromtimestamp(v / 1_000_000).isoformat()
-        elif k in JSON_COLS and isinstance(v, dict):
-            result[k] = json.dumps(v, ensure_ascii=False)
+def _date_from_epoch_days(v):
+    # Debezium DATE = days since epoch
+    if isinstance(v, (int, float)):
+        return (EPOCH + tdelta(days=int(v))).isoformat()
+    return v
+
+
+def _timestamp_from_epoch(v):
+    # Debezium TIMESTAMP = microseconds since epoch
+    if isinstance(v, (int, float)):
+        return dt.utcfromtimestamp(v / 1_000_000).isoformat()
+    return v
+
+
+def _json_from_text(v):
+    # io.debezium.data.Json chega como texto; colunas json/jsonb recebem o objeto
+    if isinstance(v, str):
+        try:
+            return json.loads(v)
+        except ValueError:
+            return v
+    return v
+
+
+CONVERTERS = {
+    "date":      _date_from_epoch_days,
+    "timestamp": _timestamp_from_epoch,
+    "json":      _json_from_text,
+}
+
+
+def compile_converters(cfg: dict) -> list[tuple]:
+    """Lista [(coluna, conversor)] com apenas as colunas que precisam de conversão."""
+    return [(col, CONVERTERS[kind]) for col, kind in cfg.get("types", {}).items()]
+
+
+# Conversores pré-compilados por topic (evita despacho por campo no loop quente)
+_TOPIC_CONVERTERS = {topic: compile_converters(cfg) for topic, cfg in TABLE_MAP.items()}
+
+# Campos esperados por topic (colunas do target, inclusive geradas, e campos __
+# do unwrap): um campo fora desse conjunto indica mudança de schema no source
+_METADATA_FIELDS = frozenset(("__op", "__table", "__lsn", "__source_ts_ms", "__deleted", "__transaction_id"))
+_KNOWN_FIELDS    = {topic: _METADATA_FIELDS | set(cfg["columns"]) for topic, cfg in TABLE_MAP.items()}
+
+
+def coerce_payload(topic: str, payload: dict) -> dict:
+    """Convert Debezium wire types to Python / PostgreSQL compatible types (in place)."""
+    for col, convert in _TOPIC_CONVERTERS.get(topic, ()):
+        v = payload.get(col)
+        if v is not None:
+            payload[col] = convert(v)
+    return payload
+
+
+# ─── Catálogo do target ───────────────────────────────────────────────────────
+
+# Tipos do target que exigem conversão do formato Debezium
+_TYPE_KINDS = {
+    "date": "date", "timestamp": "timestamp", "timestamptz": "timestamp",
+    "json": "json", "jsonb": "json",
+}
+
+_refresh_lock      = threading.Lock()
+_refresh_requested = threading.Event()
+_last_refresh      = 0.0
+_catalog_version   = 0   # incrementado a cada mudança no mapeamento
+_pending_fields: dict[str, set] = {}  # topic → campos novos vistos desde a última recarga
+_pending_lock      = threading.Lock()  # protege _pending_fields (decoders × recarga)
+_reported: set = set()
+
+
+def discover_table_map(conn, schema: str = TARGET_SCHEMA) -> tuple[dict, dict]:
+    """Lê do pg_catalog as tabelas do schema e monta (TABLE_MAP, campos conhecidos).
+
+    Colunas geradas ficam fora de "columns" (não aceitam INSERT), mas entram nos
+    campos conhecidos, e as tabelas referenciadas por FK vão em "parents".
+    Tabelas sem PK de coluna única e tabelas de controle (prefixo _) são
+    ignoradas.
+    """
+    with conn.cursor() as cur:
+        cur.execute(r"""
+            SELECT c.relname, a.attname, t.typname, a.attgenerated <> '' AS generated,
+                   COALESCE(a.attnum = ANY(i.indkey::int2[]), false) AS is_pk
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+            JOIN pg_type t ON t.oid = a.atttypid
+            LEFT JOIN pg_index i ON i.indrelid = c.oid AND i.indisprimary
+            WHERE n.nspname = %s AND c.relkind IN ('r', 'p') AND c.relname NOT LIKE '\_%%'
+            ORDER BY c.relname, a.attnum
+        """, (schema,))
+        rows = cur.fetchall()
+        cur.execute("""
+            SELECT c.relname, pn.nspname || '.' || p.relname
+            FROM pg_constraint k
+            JOIN pg_class c ON c.oid = k.conrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_class p ON p.oid = k.confrelid
+            JOIN pg_namespace pn ON pn.oid = p.relnamespace
+            WHERE k.contype = 'f' AND n.nspname = %s
+        """, (schema,))
+        foreign_keys = cur.fetchall()
+    conn.commit()
+
+    parents = {}
+    for relname, parent in foreign_keys:
+        parents.setdefault(relname, set()).add(parent)
+
+    tables = {}
+    for relname, column, typname, generated, is_pk in rows:
+        cfg = tables.setdefault(relname, {"columns": [], "types": {}, "pks": [], "all": []})
+        cfg["all"].append(column)
+        if generated:
+            continue
+        cfg["columns"].append(column)
+        if is_pk:
+            cfg["pks"].append(column)
+        if typname in _TYPE_KINDS:
+            cfg["types"][column] = _TYPE_KINDS[typname]
+
+    table_map, known = {}, {}
+    for relname, cfg in tables.items():
+        if len(cfg["pks"]) != 1:
+            logger.warning(f"Tabela {schema}.{relname} ignorada: a replicação exige PK de coluna única")
+            continue
+        topic = f"{TOPIC_PREFIX}.{schema}.{relname}"
+        table_map[topic] = {
+            "table": f"{schema}.{relname}", "pk": cfg["pks"][0],
+            "columns": cfg["columns"], "types": cfg["types"],
+            "parents": sorted(parents.get(relname, ())),
+        }
+        known[topic] = _METADATA_FIELDS | set(cfg["all"])
+    return table_map, known
+
+
+def refresh_table_map(conn) -> None:
+    """Recarrega o mapeamento a partir do catálogo do target.
+
+    As entradas são trocadas uma a uma (atribuição atômica), então threads que
+    estão lendo TABLE_MAP nunca veem o mapeamento vazio.
+    """
+    global _last_refresh, _catalog_version, _TABLE_DEPTH, _TABLE_GROUP
+    with _refresh_lock:
+        table_map, known = discover_table_map(conn)
+        _refresh_requested.clear()
+        _last_refresh = time.time()
+        if not table_map:
+            logger.warning(f"Nenhuma tabela replicável em {TARGET_SCHEMA}; mantendo o mapeamento atual.")
+            return
+
+        changed = sorted(t for t in table_map if TABLE_MAP.get(t) != table_map[t])
+        removed = sorted(t for t in TABLE_MAP if t not in table_map)
+        # Campos que continuam sem coluna no target existem só no source: passam
+        # a ser ignorados para não disparar novas recargas
+        with _pending_lock:
+            pending = dict(_pending_fields)
+            _pending_fields.clear()
+        for topic, fields in pending.items():
+            ignored = fields - known.get(topic, fields)
+            if ignored:
+                logger.warning(f"Campos sem coluna no target em {topic} serão ignorados: {sorted(ignored)}")
+                known[topic] = known[topic] | ignored
+
+        for topic, cfg in table_map.items():
+            _TOPIC_CONVERTERS[topic] = compile_converters(cfg)
+            _KNOWN_FIELDS[topic]     = known[topic]
+            TABLE_MAP[topic]         = cfg
+        for topic in removed:
+            TABLE_MAP.pop(topic, None)
+            _TOPIC_CONVERTERS.pop(topic, None)
+            _KNOWN_FIELDS.pop(topic, None)
+        TOPICS[:] = sorted(TABLE_MAP)
+        _TABLE_DEPTH, _TABLE_GROUP = build_table_order(TABLE_MAP)
+
+        if _avro_decoder is not None:
+            _avro_decoder.reset()
+        if changed or removed:
+            _catalog_version += 1
+            logger.info(f"Catálogo do target carregado: {len(TABLE_MAP)} tabelas | "
+                        f"alteradas: {changed} | removidas: {removed}")
+
+
+def request_schema_refresh(reason: str) -> None:
+    """Marca o catálogo para recarga no próximo lote (no máximo a cada SCHEMA_REFRESH_SECONDS)."""
+    if TABLE_DISCOVERY and not _refresh_requested.is_set():
+        if reason not in _reported:
+            _reported.add(reason)
+            logger.info(f"Recarga do catálogo solicitada: {reason}")
+        _refresh_requested.set()
+
+
+def schema_refresh_due() -> bool:
+    return _refresh_requested.is_set() and time.time() - _last_refresh >= SCHEMA_REFRESH_SECONDS
+
+
+def ensure_coerced(batch: dict[tuple, list[dict]], version: int) -> None:
+    """Reaplica as conversões (idempotentes) se o catálogo mudou desde `version`."""
+    if version == _catalog_version:
+        return
+    for (topic, _), payloads in batch.items():
+        for payload in payloads:
+            coerce_payload(topic, payload)
+
+
+def check_schema(topic: str, payload: dict) -> None:
+    """Detecta topics sem mapeamento e campos que o catálogo em cache não conhece."""
+    known = _KNOWN_FIELDS.get(topic)
+    if known is None:
+        request_schema_refresh(f"topic sem mapeamento {topic}")
+    elif not payload.keys() <= known:
+        new_fields = payload.keys() - known
+        with _pending_lock:
+            _pending_fields.setdefault(topic, set()).update(new_fields)
+        request_schema_refresh(f"campos novos em {topic}: {sorted(new_fields)}")
+
+
+# Statements preparados por conexão: conexão → nomes já enviados com PREPARE
+_PREPARED = weakref.WeakKeyDictionary()
+
+_STATEMENT_CACHE: dict[tuple, tuple[str, str]] = {}
+
+
+def _hashed_name(prefix: str, *parts: str) -> str:
+    """Identificador de tamanho fixo (bem abaixo dos 63 bytes do Postgres) derivado
+    de `parts` por inteiro: nomes longos de tabela não são truncados nem colidem."""
+    digest = hashlib.blake2b("\x1f".join(parts).encode(), digest_size=10).hexdigest()
+    return f"{prefix}_{digest}"
+
+
+def _statement_name(kind: str, table: str, columns: tuple) -> str:
+    return _hashed_name(f"cdc_{kind}", table, ",".join(columns))
+
+
+def upsert_statement(table: str, pk: str, columns: tuple) -> tuple[str, str]:
+    """(nome, SQL) do UPSERT de uma tabela para um conjunto de colunas.
+
+    As linhas chegam como um único parâmetro JSON e são convertidas para os
+    tipos da tabela por json_populate_recordset, então o texto do statement não
+    depende do número de linhas e pode ser preparado uma vez por conexão.
+    """
+    key = ("upsert", table, columns)
+    if key not in _STATEMENT_CACHE:
+        cols_str    = ", ".join(columns)
+        update_cols = [c for c in columns if c != pk]
+        if update_cols:
+            conflict = "DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in update_cols)
         else:
-            result[k] = v
-    return result
+            conflict = "DO NOTHING"
+        _STATEMENT_CACHE[key] = (_statement_name("upsert", table, columns), f"""
+            INSERT INTO {table} ({cols_str})
+            SELECT {cols_str} FROM json_populate_recordset(NULL::{table}, $1)
+            ON CONFLICT ({pk}) {conflict}
+        """)
+    return _STATEMENT_CACHE[key]
 
 
-def upsert_row(cur, topic: str, payload: dict) -> str | None:
-    """UPSERT de um registro no banco target. Retorna a operação aplicada."""
-    cfg     = TABLE_MAP.get(topic)
-    if not cfg:
-        return None
+def delete_statement(table: str, pk: str) -> tuple[str, str]:
+    """(nome, SQL) do DELETE por PK, com as chaves num parâmetro JSON."""
+    key = ("delete", table, (pk,))
+    if key not in _STATEMENT_CACHE:
+        _STATEMENT_CACHE[key] = (_statement_name("delete", table, (pk,)), f"""
+            DELETE FROM {table}
+            WHERE {pk} IN (SELECT {pk} FROM json_populate_recordset(NULL::{table}, $1))
+        """)
+    return _STATEMENT_CACHE[key]
 
-    table   = cfg["table"]
-    pk      = cfg["pk"]
-    columns = [c for c in cfg["columns"] if c in payload]
 
-    if not columns or pk not in payload:
-        return None
+def _execute_prepared(cur, statement: tuple[str, str], rows: list[dict]) -> None:
+    """Executa um statement preparado no servidor, preparando-o na primeira vez."""
+    name, sql = statement
+    prepared  = _PREPARED.setdefault(cur.connection, set())
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} (json) AS {sql}")
+        prepared.add(name)
+    cur.execute(f"EXECUTE {name} (%s)", (json.dumps(rows, ensure_ascii=False, default=str),))
 
-    op = payload.get("__op", "r")  # r=read/snapshot, c=create, u=update, d=delete
 
-    if op == "d":
-        cur.execute(f"DELETE FROM {table} WHERE {pk} = %s", (payload[pk],))
-        return "DELETE"
+def _csv_field(v) -> str:
+    # Vazio sem aspas = NULL; strings sempre entre aspas (preserva '')
+    if v is None:
+        return ""
+    if isinstance(v, str):
+        return '"' + v.replace('"', '""') + '"'
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (dict, list)):
+        return '"' + json.dumps(v, ensure_ascii=False).replace('"', '""') + '"'
+    return str(v)
+
+
+def copy_merge_rows(cur, table: str, pk: str, columns: tuple, rows: list[dict]) -> None:
+    """Carga em massa: COPY para uma tabela temporária e merge set-based no destino.
 
-    values       = [payload.get(c) for c in columns]
-    cols_str     = ", ".join(columns)
-    placeholders = ", ".join(["%s"] * len(columns))
-    update_cols  = [c for c in columns if c != pk]
-    update_str   = ", ".join([f"{c} = EXCLUDED.{c}" for c in update_cols])
+    Usado para os eventos de snapshot inicial (op=r), em que o custo por linha
+    do UPSERT domina o tempo de carga.
+    """
+    # O nome cobre tabela e colunas: após mudança de schema a staging é recriada
+    staging  = _hashed_name("_stg", table, ",".join(columns))
+    cols_str = ", ".join(columns)
+    cur.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table}) ON COMMIT DELETE ROWS
+    """)
+    cur.execute(f"TRUNCATE {staging}")
+
+    data = io.StringIO("".join(
+        ",".join(_csv_field(r[c]) for c in columns) + "\n" for r in rows
+    ))
+    cur.copy_expert(f"COPY {staging} ({cols_str}) FROM STDIN WITH (FORMAT csv)", data)
 
-    sql = f"""
+    update_cols = [c for c in columns if c != pk]
+    if update_cols:
+        conflict = "DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in update_cols)
+    else:
+        conflict = "DO NOTHING"
+    cur.execute(f"""
         INSERT INTO {table} ({cols_str})
-        VALUES ({placeholders})
-        ON CONFLICT ({pk}) DO UPDATE SET {update_str}
+        SELECT {cols_str} FROM {staging}
+        ON CONFLICT ({pk}) {conflict}
+    """)
+
+
+def _event_position(payload: dict) -> tuple:
+    """Posição do evento no log do source: (__lsn, __source_ts_ms)."""
+    return (payload.get("__lsn") or -1, payload.get("__source_ts_ms") or -1)
+
+
+def compact_events(cfg: dict, payloads: list[dict]) -> list[dict]:
+    """Last-write-wins: mantém apenas a versão mais recente de cada PK no lote.
+
+    A ordem é dada por __lsn / __source_ts_ms (campos adicionados pelo
+    transform unwrap); em caso de empate vale a ordem de chegada. Se a última
+    versão for um delete, apenas o DELETE é aplicado.
+    """
+    pk     = cfg["pk"]
+    latest = {}
+    for payload in payloads:
+        if pk not in payload:
+            continue
+        key     = payload[pk]
+        current = latest.get(key)
+        if current is None or _event_position(payload) >= _event_position(current):
+            latest[key] = payload
+    return list(latest.values())
+
+
+def group_rows(cfg: dict, payloads: list[dict]) -> list[tuple]:
+    """Agrupa eventos compactados por operação e conjunto de colunas.
+
+    Retorna [(op, colunas, payloads)] com op "d" (DELETE), "r" (snapshot)
+    ou "u" (UPSERT).
+    Como há no máximo uma versão por PK, a ordem entre os grupos não importa.
+    """
+    groups = {}
+    for payload in payloads:
+        columns = tuple(c for c in cfg["columns"] if c in payload)
+        if not columns:
+            continue
+        op = payload.get("__op", "r")
+        if op == "d":
+            key = ("d", ())
+        elif op == "r":
+            key = ("r", columns)
+        else:
+            key = ("u", columns)
+        groups.setdefault(key, []).append(payload)
+    return [(op, columns, rows) for (op, columns), rows in groups.items()]
+
+
+def execute_group(cur, cfg: dict, op: str, columns: tuple, rows: list[dict]) -> None:
+    """Um único EXECUTE de statement preparado (INSERT ... ON CONFLICT ou DELETE)
+    por grupo; grupos grandes de snapshot vão por COPY."""
+    table, pk = cfg["table"], cfg["pk"]
+    if op == "d":
+        _execute_prepared(cur, delete_statement(table, pk), [{pk: r[pk]} for r in rows])
+    elif op == "r" and len(rows) >= SNAPSHOT_COPY_MIN_ROWS:
+        copy_merge_rows(cur, table, pk, columns, rows)
+    else:
+        _execute_prepared(cur, upsert_statement(table, pk, columns),
+                          [{c: r[c] for c in columns} for r in rows])
+
+
+def upsert_rows(cur, topic: str, payloads: list[dict]) -> int:
+    """UPSERT multi-row de um lote de eventos do mesmo topic.
+
+    O lote é compactado (última versão por PK) e cada grupo de mesma operação
+    vira um comando (ver execute_group). Retorna o número de eventos cobertos
+    pelo lote.
+    """
+    cfg = TABLE_MAP.get(topic)
+    if not cfg:
+        return 0
+
+    for op, columns, rows in group_rows(cfg, compact_events(cfg, payloads)):
+        execute_group(cur, cfg, op, columns, rows)
+
+    return sum(1 for p in payloads if cfg["pk"] in p)
+
+
+# ─── Ordem entre tabelas ──────────────────────────────────────────────────────
+
+def build_table_order(table_map: dict) -> tuple[dict, dict]:
+    """(profundidade, grupo) por topic a partir de TABLE_PARENTS e das FKs.
+
+    A profundidade é 0 para tabelas sem pais e 1 + a maior profundidade dos
+    pais nas demais; o grupo é o menor topic do conjunto de tabelas ligadas
+    entre si. Pais fora do mapeamento são ignorados e ciclos são cortados.
+    """
+    topic_of = {cfg["table"]: topic for topic, cfg in table_map.items()}
+    parents  = {}
+    for topic, cfg in table_map.items():
+        names = set(cfg.get("parents", ())) | set(TABLE_PARENTS.get(cfg["table"], ()))
+        parents[topic] = sorted(topic_of[n] for n in names if n in topic_of and topic_of[n] != topic)
+
+    depth = {}
+
+    def visit(topic: str) -> int:
+        if topic not in depth:
+            depth[topic] = 0  # provisório: encerra ciclos
+            depth[topic] = max((visit(p) + 1 for p in parents[topic]), default=0)
+        return depth[topic]
+
+    group = {topic: topic for topic in table_map}
+
+    def find(topic: str) -> str:
+        while group[topic] != topic:
+            topic = group[topic]
+        return topic
+
+    for topic, topic_parents in parents.items():
+        visit(topic)
+        for parent in topic_parents:
+            a, b = find(topic), find(parent)
+            if a != b:
+                group[max(a, b)] = min(a, b)
+    return depth, {topic: find(topic) for topic in table_map}
+
+
+_TABLE_DEPTH, _TABLE_GROUP = build_table_order(TABLE_MAP)
+
+
+def table_depth(topic: str) -> int:
+    return _TABLE_DEPTH.get(topic, 0)
+
+
+def ordered_keys(batch: dict[tuple, list[dict]]) -> list[tuple]:
+    """Chaves (topic, partição) do lote com as tabelas pais antes das filhas."""
+    return sorted(batch, key=lambda key: table_depth(key[0]))
+
+
+def ordered_groups(batch: dict[tuple, list[dict]]) -> list[tuple]:
+    """Comandos do lote [(cfg, op, colunas, linhas)] em ordem de dependência.
+
+    Cada (topic, partição) é compactado e agrupado como em upsert_rows. Os
+    DELETEs vêm primeiro, das tabelas filhas para as pais, e depois os
+    INSERTs/UPSERTs, das pais para as filhas: um pedido é gravado antes dos
+    seus itens e os itens são removidos antes do pedido.
     """
-    cur.execute(sql, values)
-    return "UPSERT"
+    plans = []
+    for key in ordered_keys(batch):
+        cfg = TABLE_MAP.get(key[0])
+        if cfg:
+            plans.append((cfg, group_rows(cfg, compact_events(cfg, batch[key]))))
+
+    deletes = [(cfg, op, columns, rows) for cfg, groups in reversed(plans)
+               for op, columns, rows in groups if op == "d"]
+    writes  = [(cfg, op, columns, rows) for cfg, groups in plans
+               for op, columns, rows in groups if op != "d"]
+    return deletes + writes
+
+
+def covered_events(batch: dict[tuple, list[dict]]) -> dict[tuple, int]:
+    """Eventos com PK (os que o lote aplica no target) por (topic, partição)."""
+    applied = {}
+    for (topic, partition), payloads in batch.items():
+        cfg = TABLE_MAP.get(topic)
+        applied[(topic, partition)] = sum(1 for p in payloads if cfg["pk"] in p) if cfg else 0
+    return applied
+
+
+def apply_isolating(cur, topic: str, rows: list[dict], failed: list) -> None:
+    """Aplica eventos já compactados isolando os inválidos por bisseção.
+
+    Cada tentativa roda sob um SAVEPOINT; se falhar, o conjunto é dividido ao
+    meio e cada metade é reaplicada. Com k eventos inválidos em n, o custo é
+    O(k·log n) comandos em vez de um por evento. Os inválidos são anexados a
+    `failed` como (payload, erro).
+    """
+    if not rows:
+        return
+    cur.execute("SAVEPOINT isolamento")
+    try:
+        upsert_rows(cur, topic, rows)
+        cur.execute("RELEASE SAVEPOINT isolamento")
+        return
+    except Exception as e:
+        if connection_lost(e, cur.connection):
+            raise
+        cur.execute("ROLLBACK TO SAVEPOINT isolamento")
+        cur.execute("RELEASE SAVEPOINT isolamento")
+        if len(rows) == 1:
+            failed.append((rows[0], str(e).strip()))
+            return
+
+    mid = len(rows) // 2
+    apply_isolating(cur, topic, rows[:mid], failed)
+    apply_isolating(cur, topic, rows[mid:], failed)
+
+
+def write_dead_letters(cur, dead: list[tuple]) -> None:
+    """Grava eventos inválidos [(topic, partição, payload, erro)] em _pipeline_dlq.
+
+    A posição do evento no source (__lsn, __source_ts_ms) vai junto, para o
+    reprocessamento saber a versão de cada entrada.
+    """
+    if not dead:
+        return
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO public._pipeline_dlq (topic, kafka_partition, payload, error, source_lsn, source_ts_ms)
+        VALUES %s
+    """, [(t, p, json.dumps(payload, ensure_ascii=False, default=str), err,
+           payload.get("__lsn"), payload.get("__source_ts_ms"))
+          for t, p, payload, err in dead],
+        template="(%s, %s, %s::jsonb, %s, %s, %s)", page_size=len(dead))
 
 
 def ensure_target_schema(conn) -> None:
-    """Cria uma tabela de controle de pipeline no target se não existir."""
+    """Cria uma tabela de controle de pipeline no target se não existir.
+
+    A tabela guarda um registro por (topic, partição) com o último offset
+    aplicado, gravado na mesma transação que as linhas do lote.
+    """
     with conn.cursor() as cur:
         cur.execute("""
             CREATE TABLE IF NOT EXISTS public._pipeline_metadata (
-                topic       TEXT PRIMARY KEY,
-                last_offset BIGINT,
-                last_event  TIMESTAMPTZ DEFAULT NOW(),
-                event_count BIGINT DEFAULT 0
+                topic           TEXT NOT NULL,
+                kafka_partition INT NOT NULL DEFAULT 0,
+                last_offset     BIGINT,
+                last_event      TIMESTAMPTZ DEFAULT NOW(),
+                event_count     BIGINT DEFAULT 0,
+                PRIMARY KEY (topic, kafka_partition)
+            )
+        """)
+        # Migração de versões anteriores (PK apenas por topic)
+        cur.execute("""
+            ALTER TABLE public._pipeline_metadata
+                ADD COLUMN IF NOT EXISTS kafka_partition INT NOT NULL DEFAULT 0
+        """)
+        cur.execute("""
+            DO $$
+            DECLARE pk_name TEXT;
+            BEGIN
+                SELECT conname INTO pk_name FROM pg_constraint
+                 WHERE conrelid = 'public._pipeline_metadata'::regclass
+                   AND contype = 'p' AND array_length(conkey, 1) = 1;
+                IF pk_name IS NOT NULL THEN
+                    EXECUTE format('ALTER TABLE public._pipeline_metadata DROP CONSTRAINT %I', pk_name);
+                    ALTER TABLE public._pipeline_metadata ADD PRIMARY KEY (topic, kafka_partition);
+                END IF;
+            END $$
+        """)
+        # Eventos que falharam ao ser aplicados (reprocessáveis com reprocessar_dlq.py)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS public._pipeline_dlq (
+                id              BIGSERIAL PRIMARY KEY,
+                topic           TEXT NOT NULL,
+                kafka_partition INT NOT NULL DEFAULT 0,
+                payload         JSONB NOT NULL,
+                error           TEXT,
+                attempts        INT NOT NULL DEFAULT 1,
+                failed_at       TIMESTAMPTZ DEFAULT NOW(),
+                redriven_at     TIMESTAMPTZ,
+                source_lsn      BIGINT,
+                source_ts_ms    BIGINT,
+                superseded      BOOLEAN NOT NULL DEFAULT FALSE
             )
         """)
+        # Migração: posição no source e descarte por versão mais nova no target
+        cur.execute("""
+            ALTER TABLE public._pipeline_dlq
+                ADD COLUMN IF NOT EXISTS source_lsn   BIGINT,
+                ADD COLUMN IF NOT EXISTS source_ts_ms BIGINT,
+                ADD COLUMN IF NOT EXISTS superseded   BOOLEAN NOT NULL DEFAULT FALSE
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS _pipeline_dlq_pendentes
+                ON public._pipeline_dlq (topic, id) WHERE redriven_at IS NULL
+        """)
     conn.commit()
     logger.info("Schema de controle verificado.")
 
 
-def update_metadata(cur, topic: str) -> None:
-    cur.execute("""
-        INSERT INTO public._pipeline_metadata (topic, last_event, event_count)
-        VALUES (%s, NOW(), 1)
-        ON CONFLICT (topic) DO UPDATE SET
+def update_metadata(cur, offsets: dict[tuple, int], applied: dict[tuple, int]) -> None:
+    """Grava offsets e contadores de todas as partições do lote num único comando.
+
+    Os contadores são acumulados em memória durante o lote, de modo que o custo
+    de manutenção de _pipeline_metadata é O(lotes) e não O(eventos).
+    """
+    rows = [(t, p, o, applied.get((t, p), 0)) for (t, p), o in offsets.items()]
+    if not rows:
+        return
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO public._pipeline_metadata (topic, kafka_partition, last_offset, event_count)
+        VALUES %s
+        ON CONFLICT (topic, kafka_partition) DO UPDATE SET
+            last_offset = EXCLUDED.last_offset,
             last_event  = NOW(),
-            event_count = _pipeline_metadata.event_count + 1
-    """, (topic,))
+            event_count = _pipeline_metadata.event_count + EXCLUDED.event_count
+    """, rows, page_size=len(rows))
 
 
-# ─── Loop Principal ───────────────────────────────────────────────────────────
+def load_stored_offsets(conn, partitions: list) -> dict:
+    """Lê de _pipeline_metadata o próximo offset a consumir de cada partição."""
+    if not partitions:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT topic, kafka_partition, last_offset
+            FROM public._pipeline_metadata
+            WHERE topic = ANY(%s) AND last_offset IS NOT NULL
+        """, (list({p.topic for p in partitions}),))
+        stored = {(t, p): o + 1 for t, p, o in cur.fetchall()}
+    conn.commit()
+    return {(p.topic, p.partition): stored[(p.topic, p.partition)]
+            for p in partitions if (p.topic, p.partition) in stored}
 
-def main() -> None:
-    logger.info(f"Iniciando consumer → {KAFKA_BOOTSTRAP} / target: {TARGET_HOST}:{TARGET_PORT}/{TARGET_DB}")
 
-    # Aguardar Kafka estar disponível
-    for attempt in range(30):
+def assign_from_stored_offsets(consumer, partitions: list, conn) -> None:
+    """Callback de atribuição: retoma cada partição do offset confirmado no target."""
+    stored = load_stored_offsets(conn, partitions)
+    for p in partitions:
+        if (p.topic, p.partition) in stored:
+            p.offset = stored[(p.topic, p.partition)]
+    logger.info(f"Partições atribuídas: {[(p.topic, p.partition, p.offset) for p in partitions]}")
+    consumer.assign(partitions)
+
+
+if msgspec is not None:
+    class _Envelope(msgspec.Struct):
+        """Envelope {schema, payload}: o schema é pulado sem ser materializado."""
+        payload: dict | None = None
+
+    _decode_envelope = msgspec.json.Decoder(_Envelope).decode
+    _decode_json     = msgspec.json.Decoder().decode
+    _DECODE_ERRORS   = (ValueError, msgspec.DecodeError)
+    JSON_BACKEND     = "msgspec"
+elif orjson is not None:
+    _decode_envelope = None
+    _decode_json     = orjson.loads
+    _DECODE_ERRORS   = (ValueError,)
+    JSON_BACKEND     = "orjson"
+else:
+    _decode_envelope = None
+    _decode_json     = json.loads
+    _DECODE_ERRORS   = (ValueError,)
+    JSON_BACKEND     = "json"
+
+
+def _check_writer_fields(topic: str, fields: list) -> None:
+    # O registro Avro já chega projetado nas colunas do TABLE_MAP: campos novos
+    # do source só aparecem no writer schema
+    if TABLE_DISCOVERY:
+        check_schema(topic, dict.fromkeys(fields))
+
+
+def build_avro_decoder(registry_url: str):
+    """Decoder Avro com cache de schemas, projetando nas colunas do TABLE_MAP."""
+    import cdc_avro
+    return cdc_avro.AvroDecoder(cdc_avro.registry_from_url(registry_url), TABLE_MAP,
+                                on_writer_fields=_check_writer_fields)
+
+
+_avro_decoder = build_avro_decoder(SCHEMA_REGISTRY_URL) if VALUE_FORMAT == "avro" else None
+
+
+def decode_value(value: bytes):
+    """Decodifica o valor de uma mensagem direto dos bytes e devolve o payload.
+
+    Debezium wraps in {schema: ..., payload: ...} when schemas are enabled; com
+    msgspec apenas o objeto payload é materializado nesse caso.
+    """
+    if _decode_envelope is not None and value.startswith(b'{"schema"'):
+        return _decode_envelope(value).payload
+    raw = _decode_json(value)
+    # Extract the actual row data from 'payload' if present
+    return raw.get("payload", raw) if isinstance(raw, dict) else raw
+
+
+def decode_avro(topic: str, value: bytes):
+    """Decode Avro esperando o Schema Registry voltar, como o target no TargetPool.
+
+    Registry indisponível é repetido com backoff em vez de derrubar o loop de
+    consumo; schema inexistente vira AvroDecodeError (payload inválido). Com
+    encerramento solicitado o erro sobe: o lote não é gravado e as mensagens
+    são relidas no próximo start.
+    """
+    import cdc_avro
+    attempt = 0
+    while True:
+        try:
+            return _avro_decoder.decode(topic, value)
+        except cdc_avro.SchemaRegistryError as e:
+            if not e.retryable:
+                raise cdc_avro.AvroDecodeError(str(e)) from e
+            if stop_requested():
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"Schema Registry indisponível ({e}); tentativa {attempt + 1} em {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def decode_message(msg) -> dict | None:
+    """Extrai o payload de uma mensagem Debezium. Retorna None se não houver dados."""
+    error = msg.error()
+    if error:
+        if error.code() == KafkaError._PARTITION_EOF:
+            return None
+        if error.fatal():
+            raise KafkaException(error)
+        # Não fatais (ex.: topic ainda não criado no modo estático) se resolvem
+        # sozinhos; o consumer segue e recebe as mensagens quando existirem
+        logger.warning(f"Erro do Kafka ignorado em {msg.topic()}: {error.str()}")
+        return None
+
+    value = msg.value()
+    if value is None:
+        return None  # tombstone
+
+    try:
+        if _avro_decoder is not None:
+            payload = decode_avro(msg.topic(), value)
+        else:
+            payload = decode_value(value)
+    except _DECODE_ERRORS as e:
+        logger.warning(f"Payload inválido no topic {msg.topic()}: {e}")
+        return None
+    if payload is not None and not isinstance(payload, dict):
+        logger.warning(f"Payload inválido no topic {msg.topic()}: esperado objeto JSON, "
+                       f"recebido {type(payload).__name__}")
+        return None
+
+    # Skip null payloads (tombstones)
+    return payload or None
+
+
+# Erros que indicam catálogo em cache desatualizado (coluna ou tabela removida)
+_STALE_SCHEMA_ERRORS = (psycopg2.errors.UndefinedColumn, psycopg2.errors.UndefinedTable)
+
+
+def apply_batch(conn, batch: dict[tuple, list[dict]], offsets: dict[tuple, int], stats: dict,
+                version: int | None = None) -> None:
+    """Grava um lote ((topic, partição) → payloads) e seus offsets num único commit.
+
+    `version` é a versão do catálogo com que o lote foi convertido; se o
+    catálogo mudou desde então, as conversões são refeitas antes da escrita.
+    Se o lote falhar por erro de dados, os registros inválidos são isolados e
+    enviados para _pipeline_dlq, e o restante do lote é confirmado normalmente.
+    """
+    version = _catalog_version if version is None else version
+    if schema_refresh_due():
+        refresh_table_map(conn)
+    ensure_coerced(batch, version)
+    try:
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            for cfg, op, columns, rows in ordered_groups(batch):
+                execute_group(cur, cfg, op, columns, rows)
+            applied = covered_events(batch)
+            update_metadata(cur, offsets, applied)
+        written = time.perf_counter()
+        conn.commit()
+        metrics.DB_WRITE_SECONDS.observe(written - started)
+        metrics.COMMIT_SECONDS.observe(time.perf_counter() - written)
+    except Exception as e:
+        if connection_lost(e, conn):
+            raise
+        conn.rollback()
+        if TABLE_DISCOVERY and isinstance(e, _STALE_SCHEMA_ERRORS):
+            logger.warning(f"Catálogo em cache desatualizado ({str(e).strip()}); recarregando.")
+            refresh_table_map(conn)
+            ensure_coerced(batch, version)
+        else:
+            logger.warning(f"Falha ao gravar lote ({e}); isolando eventos inválidos.")
+        applied = _apply_with_dead_letters(conn, batch, offsets)
+
+    record_applied(batch, applied, stats)
+
+
+# (topic, partição) → __source_ts_ms do último evento aplicado (lag em tempo)
+last_source_ts: dict[tuple, float] = {}
+
+
+def record_applied(batch: dict[tuple, list[dict]], applied: dict[tuple, int], stats: dict) -> None:
+    """Atualiza estatísticas e métricas de um lote já confirmado no target."""
+    for (topic, _), n in applied.items():
+        stats[topic] = stats.get(topic, 0) + n
+        metrics.EVENTS.inc(n, topic)
+    metrics.BATCH_SIZE.observe(sum(applied.values()))
+
+    now_ms = time.time() * 1000
+    for key, payloads in batch.items():
+        latest = 0
+        for payload in payloads:
+            source_ts = payload.get("__source_ts_ms")
+            if source_ts:
+                metrics.END_TO_END_LAG.observe((now_ms - source_ts) / 1000, key[0])
+                latest = max(latest, source_ts)
+        if latest:
+            last_source_ts[key] = max(latest, last_source_ts.get(key, 0))
+
+
+def _apply_with_dead_letters(conn, batch: dict[tuple, list[dict]], offsets: dict[tuple, int]) -> dict:
+    """Caminho de fallback: isola os eventos inválidos e os grava em _pipeline_dlq.
+
+    Linhas válidas, eventos inválidos e offsets são confirmados na mesma
+    transação, então o lote nunca é reprocessado nem perdido. As tabelas pais
+    continuam sendo aplicadas antes das filhas.
+    """
+    applied = {}
+    dead    = []
+    with conn.cursor() as cur:
+        for topic, partition in ordered_keys(batch):
+            payloads = batch[(topic, partition)]
+            cfg = TABLE_MAP.get(topic)
+            if not cfg:
+                applied[(topic, partition)] = 0
+                continue
+            failed = []
+            apply_isolating(cur, topic, compact_events(cfg, payloads), failed)
+            for payload, error in failed:
+                logger.error(f"Evento enviado para a DLQ [{topic}]: {error} | payload: {str(payload)[:200]}")
+                dead.append((topic, partition, payload, error))
+                metrics.DEAD_LETTERS.inc(1, topic)
+            applied[(topic, partition)] = sum(1 for p in payloads if cfg["pk"] in p) - len(failed)
+        write_dead_letters(cur, dead)
+        update_metadata(cur, offsets, applied)
+    conn.commit()
+    return applied
+
+
+def commit_kafka_offsets(consumer, offsets: dict[tuple, int]) -> None:
+    """Espelha no Kafka os offsets já confirmados no target (apenas informativo).
+
+    A fonte de verdade é _pipeline_metadata; o commit no grupo mantém as
+    ferramentas de lag do Kafka coerentes com o que foi aplicado.
+    """
+    if offsets:
+        consumer.commit(
+            offsets=[TopicPartition(t, p, o + 1) for (t, p), o in offsets.items()],
+            asynchronous=True,
+        )
+
+
+# ─── Encerramento e Rebalance ─────────────────────────────────────────────────
+
+_stop_requested = threading.Event()
+
+
+def request_stop(signum=None, frame=None) -> None:
+    """Handler de SIGTERM: o loop de consumo grava o lote em construção e termina."""
+    if not _stop_requested.is_set():
+        logger.info("Encerramento solicitado; gravando lotes pendentes...")
+    _stop_requested.set()
+
+
+def stop_requested() -> bool:
+    return _stop_requested.is_set()
+
+
+class RebalanceHandler:
+    """Callbacks de rebalance do consumer.
+
+    on_assign retoma cada partição do offset gravado no target. on_revoke roda
+    antes de as partições irem para outra réplica e chama `flush` (registrado
+    pelo loop de consumo ativo), que grava o trabalho em andamento e confirma
+    os offsets; sem isso a réplica antiga poderia gravar um lote atrasado por
+    cima do que a nova já aplicou. Em on_lost as partições já podem estar com
+    outra réplica, então o trabalho é descartado sem gravar (`discard`).
+    """
+
+    def __init__(self, pool: TargetPool):
+        self.pool    = pool
+        self.flush   = None
+        self.discard = None
+
+    def on_assign(self, consumer, partitions: list) -> None:
+        self.pool.run(lambda conn: assign_from_stored_offsets(consumer, partitions, conn))
+
+    def on_revoke(self, consumer, partitions: list) -> None:
+        if self.flush is not None:
+            self.flush()
+        logger.info(f"Partições revogadas: {[(p.topic, p.partition) for p in partitions]}")
+
+    def on_lost(self, consumer, partitions: list) -> None:
+        if self.discard is not None:
+            self.discard()
+        logger.warning(f"Partições perdidas (lotes pendentes descartados): "
+                       f"{[(p.topic, p.partition) for p in partitions]}")
+
+
+# ─── Lotes e Workers ──────────────────────────────────────────────────────────
+
+class PendingTransactions:
+    """Transações do source ainda não gravadas (TRANSACTION_BATCHING).
+
+    Os eventos de dados trazem __transaction_id e o topic de transações traz,
+    no END, quantos eventos a transação gerou. Uma transação está completa
+    quando todos chegaram; como os END chegam na ordem de commit do source, só
+    é liberado o prefixo de transações completas, e as sem END (posteriores a
+    todos os END já lidos) esperam as anteriores.
+    """
+
+    def __init__(self):
+        self.open: dict[str, dict] = {}  # id → eventos [(chave, offset, payload)], esperado, END
+        self.ended: list[str] = []       # ids na ordem dos END
+        self.read: dict[tuple, int] = {}     # último offset lido por (topic, partição)
+        self.written: dict[tuple, int] = {}  # último offset gravado em _pipeline_metadata
+
+    def _get(self, tx_id: str) -> dict:
+        tx = self.open.get(tx_id)
+        if tx is None:
+            tx = self.open[tx_id] = {"events": [], "expected": None, "end": None, "since": time.time()}
+        return tx
+
+    def add_event(self, tx_id: str, key: tuple, offset: int, payload: dict) -> None:
+        self._get(tx_id)["events"].append((key, offset, payload))
+
+    def add_boundary(self, key: tuple, offset: int, payload: dict) -> None:
+        """Registra um evento do topic de transações (BEGIN é ignorado)."""
+        if payload.get("status") != "END" or "id" not in payload:
+            return
+        tx = self._get(payload["id"])
+        tx["expected"] = payload.get("event_count") or 0
+        tx["end"]      = (key, offset)
+        self.ended.append(payload["id"])
+
+    def _ready(self, tx_id: str, now: float) -> bool:
+        tx = self.open[tx_id]
+        if tx["expected"] is not None and len(tx["events"]) >= tx["expected"]:
+            return True
+        if now - tx["since"] < TRANSACTION_TIMEOUT_MS / 1000:
+            return False
+        logger.warning(f"Transação {tx_id} incompleta após {TRANSACTION_TIMEOUT_MS}ms "
+                       f"({len(tx['events'])} de {tx['expected'] if tx['expected'] is not None else '?'} "
+                       f"eventos); gravando assim mesmo.")
+        return True
+
+    def release(self) -> list[dict]:
+        """Remove e devolve as transações que podem ser gravadas, em ordem de commit."""
+        now      = time.time()
+        released = []
+        while self.ended and self._ready(self.ended[0], now):
+            released.append(self.open.pop(self.ended.pop(0)))
+        if not self.ended:
+            for tx_id in [t for t, tx in self.open.items() if tx["end"] is None]:
+                if self._ready(tx_id, now):
+                    released.append(self.open.pop(tx_id))
+        return released
+
+    def positions(self) -> dict[tuple, int]:
+        """Menor offset retido por (topic, partição)."""
+        low = {}
+        for tx in self.open.values():
+            held = [(key, offset) for key, offset, _ in tx["events"]]
+            if tx["end"] is not None:
+                held.append(tx["end"])
+            for key, offset in held:
+                if offset < low.get(key, offset + 1):
+                    low[key] = offset
+        return low
+
+
+class BatchBuffer:
+    """Lote em construção: payloads e último offset por (topic, partição)."""
+
+    def __init__(self, pending: PendingTransactions | None = None, version: int | None = None):
+        self.events: dict[tuple, list[dict]] = {}
+        self.offsets: dict[tuple, int] = {}
+        self.count = 0
+        # versão do catálogo usada nas conversões (a mais antiga, se herdar eventos retidos)
+        self.version = _catalog_version if version is None else version
+        self.pending = pending if pending is not None else PendingTransactions()
+        # Com transações retidas o lote vence mesmo sem mensagens novas (timeout)
+        self.started = time.time() if self.pending.open else None
+
+    def add(self, msg) -> None:
+        started = time.perf_counter()
+        payload = decode_message(msg)
+        if msg.error():
+            return
+        key = (msg.topic(), msg.partition())
+        self.offsets[key] = msg.offset()
+        if self.started is None:
+            self.started = time.time()
+        if payload is None:
+            return
+        if TRANSACTION_BATCHING and msg.topic() == TRANSACTION_TOPIC:
+            self.pending.add_boundary(key, msg.offset(), payload)
+            return
+
+        decoded = time.perf_counter()
+        metrics.DECODE_SECONDS.observe(decoded - started)
+        coerce_payload(msg.topic(), payload)
+        metrics.COERCE_SECONDS.observe(time.perf_counter() - decoded)
+        tx_id = payload.get("__transaction_id") if TRANSACTION_BATCHING else None
+        if tx_id:
+            self.pending.add_event(tx_id, key, msg.offset(), payload)
+        else:
+            self.events.setdefault(key, []).append(payload)
+        if TABLE_DISCOVERY:
+            check_schema(msg.topic(), payload)
+        self.count += 1
+
+    def split(self) -> "BatchBuffer":
+        """Fecha o lote para gravação e devolve o lote seguinte.
+
+        Com TRANSACTION_BATCHING, as transações liberadas entram neste lote e
+        as retidas passam para o seguinte; o offset gravado de cada partição
+        fica antes do primeiro evento retido, então um restart as relê.
+        """
+        if not TRANSACTION_BATCHING:
+            return BatchBuffer()
+
+        pending = self.pending
+        for tx in pending.release():
+            for key, _, payload in tx["events"]:
+                self.events.setdefault(key, []).append(payload)
+
+        # Offsets lidos em lotes anteriores (enquanto havia transações retidas)
+        # também podem avançar agora; só vão para o lote os que mudaram
+        pending.read.update(self.offsets)
+        held    = pending.positions()
+        offsets = {}
+        for key, offset in pending.read.items():
+            if key in held:
+                offset = min(offset, held[key] - 1)
+            if pending.written.get(key) != offset:
+                offsets[key] = offset
+        pending.written.update(offsets)
+        self.offsets = offsets
+
+        metrics.PENDING_TRANSACTIONS.set(len(pending.open))
+        if pending.open:
+            return BatchBuffer(pending, self.version)
+        return BatchBuffer()
+
+    def poll_timeout(self) -> float:
+        """Quanto esperar por mais mensagens antes de o lote vencer."""
+        if self.started is None:
+            return 1.0
+        return max(0.0, BATCH_LINGER_MS / 1000 - (time.time() - self.started))
+
+    def is_due(self) -> bool:
+        return (bool(self.offsets) or bool(self.pending.open)) and \
+            (self.count >= BATCH_SIZE or self.poll_timeout() == 0)
+
+
+def worker_for(topic: str, partition: int, n_workers: int) -> int:
+    """Roteamento estável de uma partição para um worker.
+
+    Com WORKER_TABLE_GROUPS, partições de mesmo número de tabelas relacionadas
+    (ex.: pedidos e itens_pedido) vão para o mesmo worker, ao custo de
+    concentrar o grupo inteiro numa conexão.
+    """
+    key = _TABLE_GROUP.get(topic, topic) if WORKER_TABLE_GROUPS else topic
+    return zlib.crc32(f"{key}:{partition}".encode()) % n_workers
+
+
+class PartitionWorker(threading.Thread):
+    """Thread de escrita para as partições roteadas a ela.
+
+    Recebe listas de mensagens pela inbox (fila limitada, gerando backpressure
+    no loop de consumo), grava cada lote numa conexão do pool e devolve em
+    `done` os offsets de cada lote confirmado. Os comandos "flush" (grava o
+    lote em construção) e "discard" (descarta) na inbox sinalizam `drained`
+    ao terminar.
+
+    Cada item da inbox é (geração, mensagens). drain_workers(..., "discard")
+    incrementa `generation` antes de enfileirar o comando, então mensagens
+    enfileiradas antes dele (de partições perdidas) são descartadas sem gravar.
+    """
+
+    def __init__(self, index: int, pool: TargetPool, done: queue.Queue):
+        super().__init__(name=f"cdc-worker-{index}", daemon=True)
+        self.inbox    = queue.Queue(maxsize=WORKER_QUEUE_SIZE)
+        self.pool     = pool
+        self.done     = done
+        self.stats    = {t: 0 for t in TOPICS}
+        self.stopping = threading.Event()
+        self.drained  = threading.Event()
+        self.error    = None
+        self.generation = 0
+
+    def run(self) -> None:
+        try:
+            self._loop()
+        except Exception as e:
+            self.error = e
+            logger.exception(f"[{self.name}] Worker encerrado com erro: {e}")
+
+    def _write(self, buffer: BatchBuffer, generation: int) -> BatchBuffer:
+        following = buffer.split()
+        if generation != self.generation:
+            return BatchBuffer()  # lote de antes de um discard: partições perdidas
+        if buffer.events or buffer.offsets:
+            # Em falha de conexão o lote é reaplicado numa nova conexão do pool
+            self.pool.run(lambda conn: apply_batch(conn, buffer.events, buffer.offsets, self.stats, buffer.version))
+            self.done.put(buffer.offsets)
+        return following
+
+    def _loop(self) -> None:
+        buffer, generation = BatchBuffer(), self.generation
+        while not self.stopping.is_set():
+            try:
+                item = self.inbox.get(timeout=buffer.poll_timeout())
+            except queue.Empty:
+                item = (generation, [])
+
+            if item in ("flush", "discard"):
+                if item == "flush":
+                    self._write(buffer, generation)
+                buffer, generation = BatchBuffer(), self.generation
+                self.drained.set()
+                continue
+
+            item_generation, msgs = item
+            if item_generation != self.generation:
+                continue  # enfileirado antes de um discard
+            if item_generation != generation:
+                buffer, generation = BatchBuffer(), item_generation
+            for msg in msgs:
+                buffer.add(msg)
+            if buffer.is_due():
+                buffer = self._write(buffer, generation)
+
+
+def _check_workers(workers: list) -> None:
+    failed = [w for w in workers if w.error is not None]
+    if failed:
+        raise RuntimeError(f"{failed[0].name} falhou: {failed[0].error}")
+
+
+def consume_inline(consumer, pool: TargetPool, rebalance: "RebalanceHandler | None" = None) -> None:
+    """Loop de consumo sem workers: os lotes são gravados na thread do consumer.
+
+    Termina, gravando o lote em construção, quando request_stop é chamado.
+    """
+    stats    = {t: 0 for t in TOPICS}
+    last_log = time.time()
+    buffer   = BatchBuffer()
+
+    def write(buffer: BatchBuffer) -> BatchBuffer:
+        following = buffer.split()
+        if buffer.events or buffer.offsets:  # vazio quando só há transações retidas
+            # Em falha de conexão o lote é reaplicado após a reconexão
+            pool.run(lambda conn: apply_batch(conn, buffer.events, buffer.offsets, stats, buffer.version))
+            commit_kafka_offsets(consumer, buffer.offsets)
+        return following
+
+    def flush() -> None:
+        # Transações retidas não são gravadas: o offset salvo fica antes delas
+        # e quem assumir as partições as relê
+        nonlocal buffer
+        write(buffer)
+        buffer = BatchBuffer()
+
+    def discard() -> None:
+        nonlocal buffer
+        buffer = BatchBuffer()
+
+    if rebalance is not None:
+        rebalance.flush, rebalance.discard = flush, discard
+
+    try:
+        while not stop_requested():
+            msgs = consumer.consume(
+                num_messages=max(1, BATCH_SIZE - buffer.count), timeout=buffer.poll_timeout()
+            )
+
+            if not msgs and not buffer.offsets and not buffer.pending.open:
+                # Log periódico de estatísticas
+                if time.time() - last_log > 30:
+                    total = sum(stats.values())
+                    logger.info(f"Heartbeat — Total processado: {total} eventos | {stats}")
+                    last_log = time.time()
+                continue
+
+            for msg in msgs:
+                buffer.add(msg)
+
+            if not buffer.is_due():
+                continue
+
+            total_before = sum(stats.values())
+            buffer = write(buffer)
+
+            total = sum(stats.values())
+            if total // 50 > total_before // 50:
+                logger.info(f"Processado: {stats}")
+
+        flush()
+        logger.info(f"Consumer encerrado. Total processado: {sum(stats.values())} eventos | {stats}")
+    finally:
+        if rebalance is not None:
+            rebalance.flush = rebalance.discard = None
+
+
+def _send(worker: PartitionWorker, workers: list, item) -> None:
+    while True:
+        _check_workers(workers)
+        try:
+            worker.inbox.put(item, timeout=1.0)
+            return
+        except queue.Full:
+            continue
+
+
+def drain_workers(workers: list, command: str) -> None:
+    """Envia "flush" ou "discard" a todos os workers e espera cada um concluir.
+
+    Com "flush" as mensagens já enfileiradas são gravadas antes; com "discard"
+    elas são descartadas (nova geração), pois as partições podem já estar com
+    outra réplica.
+    """
+    for w in workers:
+        w.drained.clear()
+        if command == "discard":
+            w.generation += 1
+        _send(w, workers, command)
+    for w in workers:
+        while not w.drained.wait(timeout=1.0):
+            _check_workers(workers)
+
+
+def consume_with_workers(consumer, pool: TargetPool, n_workers: int,
+                         rebalance: "RebalanceHandler | None" = None) -> None:
+    """Loop de consumo com pool de workers, roteando mensagens por partição.
+
+    Termina, drenando os workers, quando request_stop é chamado.
+    """
+    done    = queue.Queue()
+    workers = [PartitionWorker(i, pool, done) for i in range(n_workers)]
+    for w in workers:
+        w.start()
+    logger.info(f"Pool de {n_workers} workers iniciado")
+
+    def commit_done() -> None:
+        while not done.empty():
+            commit_kafka_offsets(consumer, done.get_nowait())
+
+    def flush() -> None:
+        drain_workers(workers, "flush")
+        commit_done()
+
+    if rebalance is not None:
+        rebalance.flush   = flush
+        rebalance.discard = lambda: drain_workers(workers, "discard")
+
+    routes     = {}  # (topic, partição) → worker, fixo mesmo se o catálogo mudar
+    last_log   = time.time()
+    total_prev = 0
+    try:
+        while not stop_requested():
+            msgs   = consumer.consume(num_messages=BATCH_SIZE, timeout=1.0)
+            routed = {}
+            for msg in msgs:
+                if msg.error():
+                    decode_message(msg)  # levanta só erros fatais
+                    continue
+                key = (msg.topic(), msg.partition())
+                if key not in routes:
+                    routes[key] = worker_for(*key, n_workers)
+                routed.setdefault(routes[key], []).append(msg)
+            for index, batch in routed.items():
+                _send(workers[index], workers, (workers[index].generation, batch))
+
+            commit_done()
+            _check_workers(workers)
+
+            stats = {t: sum(w.stats.get(t, 0) for w in workers) for t in TOPICS}
+            total = sum(stats.values())
+            if total // 50 > total_prev // 50 or time.time() - last_log > 30:
+                logger.info(f"Processado: {stats}")
+                last_log = time.time()
+            total_prev = total
+
+        flush()
+        logger.info("Workers drenados; consumer encerrado.")
+    finally:
+        if rebalance is not None:
+            rebalance.flush = rebalance.discard = None
+        for w in workers:
+            w.stopping.set()
+        for w in workers:
+            w.join(timeout=10)
+
+
+# ─── Loop Principal ───────────────────────────────────────────────────────────
+
+def wait_for_kafka(attempts: int = 30) -> bool:
+    """Aguarda o broker responder. Retorna False se não ficar disponível."""
+    for attempt in range(attempts):
         try:
             test_consumer = Consumer({
                 "bootstrap.servers": KAFKA_BOOTSTRAP,
@@ -204,96 +1628,123 @@ def main() -> None:
             test_consumer.list_topics(timeout=5)
             test_consumer.close()
             logger.info("Kafka disponível!")
-            break
+            return True
         except Exception as e:
-            logger.info(f"Aguardando Kafka... ({attempt+1}/30): {e}")
+            logger.info(f"Aguardando Kafka... ({attempt+1}/{attempts}): {e}")
             time.sleep(5)
-    else:
-        logger.error("Kafka não ficou disponível em 150s. Encerrando.")
+    logger.error(f"Kafka não ficou disponível em {attempts * 5}s. Encerrando.")
+    return False
+
+
+def subscription() -> list[str]:
+    """Regex dos topics do schema (descoberta ativa) ou a lista estática, mais o
+    topic de transações com TRANSACTION_BATCHING.
+
+    O topic de transações entra como regex: o Debezium só o cria na primeira
+    transação, e um nome literal inexistente viraria erro UNKNOWN_TOPIC_OR_PART
+    no consumo em vez de ser assinado quando aparecer.
+    """
+    topics = [TOPIC_PATTERN] if TABLE_DISCOVERY else list(TOPICS)
+    if TRANSACTION_BATCHING:
+        topics.append(f"^{re.escape(TRANSACTION_TOPIC)}$")
+    return topics
+
+
+def check_transaction_topic(consumer) -> None:
+    """Avisa se TRANSACTION_BATCHING está ativo e o topic de transações não existe.
+
+    Enquanto ele não aparece (conector sem provide.transaction.metadata ou sem
+    transações ainda) nenhuma transação fecha: os eventos com transaction.id
+    só são gravados após TRANSACTION_TIMEOUT_MS.
+    """
+    if not TRANSACTION_BATCHING:
+        return
+    try:
+        exists = TRANSACTION_TOPIC in consumer.list_topics(timeout=10).topics
+    except KafkaException as e:
+        logger.warning(f"Não foi possível verificar o topic {TRANSACTION_TOPIC}: {e}")
         return
+    if not exists:
+        logger.warning(f"TRANSACTION_BATCHING ativo mas o topic {TRANSACTION_TOPIC} não existe; "
+                       f"transações serão gravadas após TRANSACTION_TIMEOUT_MS ({TRANSACTION_TIMEOUT_MS}ms) "
+                       f"até o Debezium criá-lo (provide.transaction.metadata no conector).")
 
-    consumer = Consumer({
+
+def start_lag_monitor():
+    """Monitor de lag com um consumer próprio do mesmo grupo (sem subscribe)."""
+    import cdc_lag
+    config = {k: v for k, v in consumer_config().items()
+              if k in ("bootstrap.servers", "group.id", "enable.auto.commit")}
+
+    def topics() -> list[str]:
+        return list(TOPICS) + ([TRANSACTION_TOPIC] if TRANSACTION_BATCHING else [])
+
+    return cdc_lag.start_lag_monitor(config, topics, last_source_ts, LAG_INTERVAL_SECONDS)
+
+
+def consumer_config() -> dict:
+    return {
         "bootstrap.servers": KAFKA_BOOTSTRAP,
         "group.id": "debezium-to-pg-v4",
         "auto.offset.reset": "earliest",
-        "enable.auto.commit": True,
-        "auto.commit.interval.ms": 1000,
+        # Offsets são gravados em _pipeline_metadata junto com as linhas do lote
+        "enable.auto.commit": False,
+        "enable.auto.offset.store": False,
         "session.timeout.ms": 30000,
         "heartbeat.interval.ms": 3000,
         "max.poll.interval.ms": 300000,
-    })
-    consumer.subscribe(TOPICS)
+    }
 
-    conn = None
-    stats = {t: 0 for t in TOPICS}
-    last_log = time.time()
 
-    try:
-        conn = get_db_conn()
-        ensure_target_schema(conn)
-
-        logger.info(f"Subscrito em: {TOPICS}")
-        logger.info("Aguardando eventos CDC...")
-
-        while True:
-            msg = consumer.poll(timeout=1.0)
-
-            if msg is None:
-                # Log periódico de estatísticas
-                if time.time() - last_log > 30:
-                    total = sum(stats.values())
-                    logger.info(f"Heartbeat — Total processado: {total} eventos | {stats}")
-                    last_log = time.time()
-                continue
+def main() -> None:
+    logger.info(f"Iniciando consumer → {KAFKA_BOOTSTRAP} / target: {TARGET_HOST}:{TARGET_PORT}/{TARGET_DB}")
 
-            if msg.error():
-                if msg.error().code() == KafkaError._PARTITION_EOF:
-                    continue
-                raise KafkaException(msg.error())
+    # Aguardar Kafka estar disponível
+    if not wait_for_kafka():
+        return
 
-            topic   = msg.topic()
-            value   = msg.value()
-            if value is None:
-                continue  # tombstone
+    consumer = Consumer(consumer_config())
 
-            try:
-                raw = json.loads(value.decode("utf-8"))
-            except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                logger.warning(f"Payload inválido no topic {topic}: {e}")
-                continue
+    # Uma conexão por worker + uma para o callback de atribuição
+    pool        = TargetPool(maxconn=max(1, CONSUMER_WORKERS) + 1)
+    rebalance   = RebalanceHandler(pool)
+    lag_monitor = None
+    signal.signal(signal.SIGTERM, request_stop)
 
-            # Debezium wraps in {schema: ..., payload: ...} even with schemas disabled
-            # Extract the actual row data from 'payload' if present
-            payload = raw.get("payload", raw) if isinstance(raw, dict) else raw
+    try:
+        metrics.start_metrics_server(METRICS_PORT)
+        lag_monitor = start_lag_monitor()
+        pool.run(ensure_target_schema)
+        if TABLE_DISCOVERY:
+            pool.run(refresh_table_map)
+        check_transaction_topic(consumer)
+        consumer.subscribe(subscription(), on_assign=rebalance.on_assign,
+                           on_revoke=rebalance.on_revoke, on_lost=rebalance.on_lost)
 
-            # Skip null payloads (tombstones)
-            if not payload:
-                continue
+        logger.info(f"Subscrito em: {subscription()} | tabelas: {TOPICS}")
+        logger.info(f"Lotes de até {BATCH_SIZE} eventos / {BATCH_LINGER_MS}ms | "
+                    f"formato: {VALUE_FORMAT} | JSON: {JSON_BACKEND} | "
+                    f"por transação: {TRANSACTION_BATCHING}")
+        logger.info("Aguardando eventos CDC...")
 
-            try:
-                with conn.cursor() as cur:
-                    op = upsert_row(cur, topic, coerce_payload(payload))
-                    if op:
-                        update_metadata(cur, topic)
-                        stats[topic] = stats.get(topic, 0) + 1
-                conn.commit()
-
-                if sum(stats.values()) % 50 == 0:
-                    logger.info(f"Processado: {stats}")
-
-            except psycopg2.OperationalError:
-                logger.warning("Reconectando ao target DB...")
-                conn = get_db_conn()
-            except Exception as e:
-                logger.error(f"Erro ao processar evento [{topic}]: {e} | payload: {str(payload)[:200]}")
-                conn.rollback()
+        if CONSUMER_WORKERS > 1 and TRANSACTION_BATCHING:
+            # Uma transação envolve topics de vários workers: o lote tem que ser único
+            logger.warning(f"TRANSACTION_BATCHING ativo: CONSUMER_WORKERS={CONSUMER_WORKERS} ignorado, "
+                           f"todos os lotes são gravados na thread do consumer (1 conexão). "
+                           f"Use TRANSACTION_BATCHING=false para paralelizar por partição.")
+            consume_inline(consumer, pool, rebalance)
+        elif CONSUMER_WORKERS > 1:
+            consume_with_workers(consumer, pool, CONSUMER_WORKERS, rebalance)
+        else:
+            consume_inline(consumer, pool, rebalance)
 
     except KeyboardInterrupt:
         logger.info("Consumer encerrado pelo usuário.")
     finally:
+        if lag_monitor is not None:
+            lag_monitor.stop()
         consumer.close()
-        if conn:
-            conn.close()
+        pool.close()
 
 
 if __name__ == "__main__":
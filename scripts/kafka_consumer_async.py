@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Kafka Consumer assíncrono - Debezium CDC Events → PostgreSQL Target
+Variante asyncio do kafka_consumer.py: fetch no Kafka, decode e escrita no
+target rodam em paralelo, ligados por filas limitadas (backpressure). Cada
+lote é enviado ao target em pipeline mode do psycopg 3, sem esperar a
+resposta de um comando para enviar o próximo.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import kafka_consumer as kc
+from kafka_consumer import Consumer
+
+try:
+    import psycopg
+    from psycopg.types.json import Json
+except ImportError:
+    import subprocess
+    import sys
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "psycopg[binary]", "-q"])
+    import psycopg
+    from psycopg.types.json import Json
+
+logger = logging.getLogger("kafka_consumer_async")
+
+# ─── Configuração ─────────────────────────────────────────────────────────────
+
+# Listas de mensagens aguardando decode e lotes aguardando escrita
+FETCH_QUEUE_SIZE = int(os.getenv("ASYNC_FETCH_QUEUE_SIZE", "16"))
+WRITE_QUEUE_SIZE = int(os.getenv("ASYNC_WRITE_QUEUE_SIZE", "2"))
+
+METADATA_SQL = """
+    INSERT INTO public._pipeline_metadata (topic, kafka_partition, last_offset, event_count)
+    SELECT topic, kafka_partition, last_offset, event_count
+    FROM json_to_recordset(%s) AS m(topic TEXT, kafka_partition INT, last_offset BIGINT, event_count BIGINT)
+    ON CONFLICT (topic, kafka_partition) DO UPDATE SET
+        last_offset = EXCLUDED.last_offset,
+        last_event  = NOW(),
+        event_count = _pipeline_metadata.event_count + EXCLUDED.event_count
+"""
+
+# Mesma serialização do caminho síncrono (kc._execute_prepared e
+# kc.write_dead_letters): valores fora do JSON, como bytes vindos do Avro,
+# viram texto em vez de derrubar o lote
+_dumps = functools.partial(json.dumps, ensure_ascii=False, default=str)
+
+DLQ_SQL = """
+    INSERT INTO public._pipeline_dlq (topic, kafka_partition, payload, error, source_lsn, source_ts_ms)
+    SELECT topic, kafka_partition, payload, error, source_lsn, source_ts_ms
+    FROM json_to_recordset(%s) AS d(topic TEXT, kafka_partition INT, payload JSONB, error TEXT,
+                                    source_lsn BIGINT, source_ts_ms BIGINT)
+"""
+
+
+# ─── Escrita no target ────────────────────────────────────────────────────────
+
+async def get_async_conn():
+    """Cria conexão assíncrona (psycopg 3) com o banco target."""
+    return await psycopg.AsyncConnection.connect(
+        host=kc.TARGET_HOST, port=kc.TARGET_PORT, dbname=kc.TARGET_DB,
+        user=kc.TARGET_USER, password=kc.TARGET_PASSWORD
+    )
+
+
+def _pg3_sql(statement: tuple[str, str]) -> str:
+    # Os statements do consumer usam $1 (PREPARE); no psycopg 3 o parâmetro é %s
+    # e o prepare fica a cargo do driver (prepare=True)
+    return statement[1].replace("$1", "%s")
+
+
+def _connection_lost(e: BaseException, conn) -> bool:
+    # Mesmo critério de kc.connection_lost, com os atributos do psycopg 3
+    if isinstance(e, psycopg.InterfaceError) or conn.broken or conn.closed:
+        return True
+    if not isinstance(e, psycopg.OperationalError):
+        return False
+    if e.sqlstate is None:
+        return type(e) is psycopg.OperationalError
+    return e.sqlstate.startswith(kc._CONNECTION_SQLSTATES)
+
+
+async def _execute_group(cur, cfg: dict, op: str, columns: tuple, rows: list[dict]) -> None:
+    table, pk = cfg["table"], cfg["pk"]
+    if op == "d":
+        sql, data = _pg3_sql(kc.delete_statement(table, pk)), [{pk: r[pk]} for r in rows]
+    else:
+        # COPY não é suportado em pipeline mode: snapshots usam o UPSERT preparado
+        sql, data = _pg3_sql(kc.upsert_statement(table, pk, columns)), \
+            [{c: r[c] for c in columns} for r in rows]
+    await cur.execute(sql, (Json(data, dumps=_dumps),), prepare=True)
+
+
+async def _execute_groups(cur, topic: str, payloads: list[dict]) -> int:
+    """Envia os comandos de um conjunto de eventos do mesmo topic."""
+    cfg = kc.TABLE_MAP.get(topic)
+    if not cfg:
+        return 0
+
+    for op, columns, rows in kc.group_rows(cfg, kc.compact_events(cfg, payloads)):
+        await _execute_group(cur, cfg, op, columns, rows)
+
+    return sum(1 for p in payloads if cfg["pk"] in p)
+
+
+async def _write_metadata(cur, offsets: dict[tuple, int], applied: dict[tuple, int]) -> None:
+    rows = [{"topic": t, "kafka_partition": p, "last_offset": o, "event_count": applied.get((t, p), 0)}
+            for (t, p), o in offsets.items()]
+    if rows:
+        await cur.execute(METADATA_SQL, (Json(rows, dumps=_dumps),))
+
+
+async def _refresh_catalog(pool: "kc.TargetPool") -> None:
+    # O catálogo é lido pela conexão síncrona, fora do event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, pool.run, kc.refresh_table_map)
+
+
+async def write_batch(conn, buffer: "kc.BatchBuffer", pool: "kc.TargetPool") -> dict:
+    """Grava um lote em pipeline mode e confirma linhas + offsets num único commit.
+
+    Os comandos seguem kc.ordered_groups (tabelas pais antes das filhas).
+    Se o lote falhar por erro de dados, os eventos inválidos vão para _pipeline_dlq
+    e o restante do lote é confirmado.
+    """
+    try:
+        async with conn.pipeline():
+            async with conn.cursor() as cur:
+                for cfg, op, columns, rows in kc.ordered_groups(buffer.events):
+                    await _execute_group(cur, cfg, op, columns, rows)
+                applied = kc.covered_events(buffer.events)
+                await _write_metadata(cur, buffer.offsets, applied)
+        await conn.commit()
+        return applied
+    except Exception as e:
+        # Como em kc.apply_batch: qualquer falha que não seja de conexão isola
+        # os eventos inválidos em vez de derrubar o pipeline
+        if _connection_lost(e, conn):
+            raise
+        await conn.rollback()
+        if kc.TABLE_DISCOVERY and isinstance(e, (psycopg.errors.UndefinedColumn, psycopg.errors.UndefinedTable)):
+            logger.warning(f"Catálogo em cache desatualizado ({str(e).strip()}); recarregando.")
+            await _refresh_catalog(pool)
+            kc.ensure_coerced(buffer.events, buffer.version)
+        else:
+            logger.warning(f"Falha ao gravar lote ({e}); isolando eventos inválidos.")
+        return await _write_with_dead_letters(conn, buffer)
+
+
+async def _apply_isolating(conn, cur, topic: str, rows: list[dict], failed: list) -> None:
+    # Mesma bisseção de kc.apply_isolating, com SAVEPOINTs via conn.transaction()
+    if not rows:
+        return
+    try:
+        async with conn.transaction():
+            await _execute_groups(cur, topic, rows)
+        return
+    except Exception as e:
+        if _connection_lost(e, conn):
+            raise
+        if len(rows) == 1:
+            failed.append((rows[0], str(e).strip()))
+            return
+
+    mid = len(rows) // 2
+    await _apply_isolating(conn, cur, topic, rows[:mid], failed)
+    await _apply_isolating(conn, cur, topic, rows[mid:], failed)
+
+
+async def _write_with_dead_letters(conn, buffer: "kc.BatchBuffer") -> dict:
+    applied = {}
+    dead    = []
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            for topic, partition in kc.ordered_keys(buffer.events):
+                payloads = buffer.events[(topic, partition)]
+                cfg = kc.TABLE_MAP.get(topic)
+                if not cfg:
+                    applied[(topic, partition)] = 0
+                    continue
+                failed = []
+                await _apply_isolating(conn, cur, topic, kc.compact_events(cfg, payloads), failed)
+                for payload, error in failed:
+                    logger.error(f"Evento enviado para a DLQ [{topic}]: {error} | payload: {str(payload)[:200]}")
+                    dead.append({"topic": topic, "kafka_partition": partition, "payload": payload, "error": error,
+                                 "source_lsn": payload.get("__lsn"), "source_ts_ms": payload.get("__source_ts_ms")})
+                    kc.metrics.DEAD_LETTERS.inc(1, topic)
+                applied[(topic, partition)] = sum(1 for p in payloads if cfg["pk"] in p) - len(failed)
+            if dead:
+                await cur.execute(DLQ_SQL, (Json(dead, dumps=_dumps),))
+            await _write_metadata(cur, buffer.offsets, applied)
+    return applied
+
+
+# ─── Estágios do pipeline ─────────────────────────────────────────────────────
+
+# Geração do pipeline: um drain com descarte (partições perdidas) a incrementa,
+# e mensagens e lotes enfileirados antes dele, marcados com a geração anterior,
+# são descartados sem gravar
+_generation = 0
+
+
+class Drain:
+    """Marcador que percorre o pipeline atrás das mensagens já buscadas.
+
+    O decode grava (write=True) ou descarta o lote em construção e o repassa;
+    o write resolve `done` quando tudo o que veio antes está confirmado (ou,
+    com write=False, descartado).
+    """
+
+    def __init__(self, write: bool):
+        self.write = write
+        self.done  = asyncio.get_running_loop().create_future()
+
+
+async def drain(fetch_queue: asyncio.Queue, commits: asyncio.Queue, write: bool) -> list[dict]:
+    """Esvazia o pipeline e devolve os offsets confirmados ainda não espelhados no Kafka."""
+    global _generation
+    if not write:
+        _generation += 1
+    marker = Drain(write)
+    await fetch_queue.put(marker)
+    await marker.done
+    offsets = []
+    while not commits.empty():
+        offsets.append(commits.get_nowait())
+    return offsets
+
+
+async def fetch_loop(consumer, kafka_executor, fetch_queue: asyncio.Queue, commits: asyncio.Queue) -> None:
+    """Busca mensagens no Kafka (em thread dedicada) e espelha offsets confirmados.
+
+    Com request_stop (SIGTERM), drena o pipeline e termina.
+    """
+    loop = asyncio.get_running_loop()
+    while not kc.stop_requested():
+        while not commits.empty():
+            await loop.run_in_executor(kafka_executor, kc.commit_kafka_offsets, consumer, commits.get_nowait())
+        msgs = await loop.run_in_executor(kafka_executor, consumer.consume, kc.BATCH_SIZE, 0.5)
+        if msgs:
+            await fetch_queue.put((_generation, msgs))
+
+    for offsets in await drain(fetch_queue, commits, write=True):
+        await loop.run_in_executor(kafka_executor, kc.commit_kafka_offsets, consumer, offsets)
+    logger.info("Pipeline drenado; consumer encerrado.")
+
+
+async def decode_loop(fetch_queue: asyncio.Queue, write_queue: asyncio.Queue) -> None:
+    """Decodifica e monta lotes; entrega cada lote vencido ao estágio de escrita
+    como (geração, lote)."""
+    buffer, generation = kc.BatchBuffer(), _generation
+    while True:
+        try:
+            item = await asyncio.wait_for(fetch_queue.get(), timeout=buffer.poll_timeout())
+        except asyncio.TimeoutError:
+            item = (generation, [])
+        if isinstance(item, Drain):
+            if item.write:
+                buffer.split()  # transações retidas ficam para quem assumir as partições
+                if buffer.events or buffer.offsets:
+                    await write_queue.put((generation, buffer))
+            buffer, generation = kc.BatchBuffer(), _generation
+            await write_queue.put(item)
+            continue
+        item_generation, msgs = item
+        if item_generation != _generation:
+            continue  # buscado antes de um descarte
+        if item_generation != generation:
+            buffer, generation = kc.BatchBuffer(), item_generation
+        for msg in msgs:
+            buffer.add(msg)
+        if buffer.is_due():
+            following = buffer.split()
+            if buffer.events or buffer.offsets:  # vazio quando só há transações retidas
+                await write_queue.put((generation, buffer))
+            buffer = following
+
+
+async def _reconnect(conn):
+    """Reabre a conexão com o target com backoff exponencial e jitter."""
+    if conn is not None:
+        await conn.close()
+    attempt = 0
+    while True:
+        try:
+            return await get_async_conn()
+        except psycopg.OperationalError as e:
+            delay = kc.backoff_delay(attempt)
+            attempt += 1
+            logger.warning(f"Target indisponível ({str(e).strip()}); tentativa {attempt} em {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def write_loop(write_queue: asyncio.Queue, commits: asyncio.Queue, stats: dict,
+                     pool: "kc.TargetPool") -> None:
+    """Aplica os lotes no target; em falha de conexão reconecta e reaplica o lote."""
+    conn = await _reconnect(None)
+    try:
+        while True:
+            item = await write_queue.get()
+            if isinstance(item, Drain):
+                item.done.set_result(None)
+                continue
+            generation, buffer = item
+            if generation != _generation:
+                continue  # montado antes de um descarte: partições perdidas
+            if kc.schema_refresh_due():
+                await _refresh_catalog(pool)
+            kc.ensure_coerced(buffer.events, buffer.version)
+            while True:
+                try:
+                    applied = await write_batch(conn, buffer, pool)
+                    break
+                except Exception as e:
+                    if not _connection_lost(e, conn):
+                        raise
+                    logger.warning(f"Falha de conexão com o target ({str(e).strip()}); reaplicando lote...")
+                    conn = await _reconnect(conn)
+
+            total_before = sum(stats.values())
+            kc.record_applied(buffer.events, applied, stats)
+            commits.put_nowait(buffer.offsets)
+            if sum(stats.values()) // 50 > total_before // 50:
+                logger.info(f"Processado: {stats}")
+    finally:
+        await conn.close()
+
+
+async def run(consumer, kafka_executor, pool: "kc.TargetPool",
+              rebalance: "kc.RebalanceHandler | None" = None) -> None:
+    fetch_queue = asyncio.Queue(maxsize=FETCH_QUEUE_SIZE)
+    write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+    commits     = asyncio.Queue()
+    stats       = {t: 0 for t in kc.TOPICS}
+    loop        = asyncio.get_running_loop()
+
+    def blocking_drain(write: bool) -> None:
+        # Chamado pelos callbacks de rebalance, na thread do Kafka (dentro de consume)
+        for offsets in asyncio.run_coroutine_threadsafe(drain(fetch_queue, commits, write), loop).result():
+            kc.commit_kafka_offsets(consumer, offsets)
+
+    if rebalance is not None:
+        rebalance.flush   = lambda: blocking_drain(True)
+        rebalance.discard = lambda: blocking_drain(False)
+
+    tasks = [
+        asyncio.create_task(fetch_loop(consumer, kafka_executor, fetch_queue, commits), name="fetch"),
+        asyncio.create_task(decode_loop(fetch_queue, write_queue), name="decode"),
+        asyncio.create_task(write_loop(write_queue, commits, stats, pool), name="write"),
+    ]
+    try:
+        # Qualquer estágio que termine (erro) encerra o pipeline
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        if rebalance is not None:
+            rebalance.flush = rebalance.discard = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# ─── Loop Principal ───────────────────────────────────────────────────────────
+
+def main() -> None:
+    logger.info(f"Iniciando consumer async → {kc.KAFKA_BOOTSTRAP} / target: {kc.TARGET_HOST}:{kc.TARGET_PORT}/{kc.TARGET_DB}")
+
+    if not kc.wait_for_kafka():
+        return
+
+    consumer = Consumer(kc.consumer_config())
+    # Todas as chamadas ao consumer ficam na mesma thread
+    kafka_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kafka")
+    # Conexão síncrona para o schema de controle, o catálogo e o callback de atribuição
+    pool        = kc.TargetPool(maxconn=1)
+    rebalance   = kc.RebalanceHandler(pool)
+    lag_monitor = None
+    signal.signal(signal.SIGTERM, kc.request_stop)
+
+    try:
+        kc.metrics.start_metrics_server(kc.METRICS_PORT)
+        lag_monitor = kc.start_lag_monitor()
+        pool.run(kc.ensure_target_schema)
+        if kc.TABLE_DISCOVERY:
+            pool.run(kc.refresh_table_map)
+        kc.check_transaction_topic(consumer)
+        consumer.subscribe(kc.subscription(), on_assign=rebalance.on_assign,
+                           on_revoke=rebalance.on_revoke, on_lost=rebalance.on_lost)
+        logger.info(f"Subscrito em: {kc.subscription()} | tabelas: {kc.TOPICS} | JSON: {kc.JSON_BACKEND}")
+        asyncio.run(run(consumer, kafka_executor, pool, rebalance))
+    except KeyboardInterrupt:
+        logger.info("Consumer encerrado pelo usuário.")
+    finally:
+        if lag_monitor is not None:
+            lag_monitor.stop()
+        kafka_executor.submit(consumer.close).result()
+        kafka_executor.shutdown()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
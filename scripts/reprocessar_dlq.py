@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Reprocessamento da DLQ do consumer CDC
+Reaplica em massa os eventos pendentes de public._pipeline_dlq (depois de
+corrigida a causa da falha no target) pelo mesmo caminho de escrita do
+consumer. Eventos que voltarem a falhar continuam pendentes, com o erro e o
+número de tentativas atualizados. Eventos cuja linha no target já tem versão
+mais nova (updated_at maior) não são reaplicados: ficam marcados como
+superseded.
+
+Uso:
+    python3 reprocessar_dlq.py                    # reaplica todos os pendentes
+    python3 reprocessar_dlq.py --topic dbserver1.public.pedidos --limit 1000
+    python3 reprocessar_dlq.py --list             # apenas resume os pendentes
+"""
+
+import argparse
+import json
+import logging
+
+import psycopg2.extras
+
+import kafka_consumer as kc
+
+logger = logging.getLogger("reprocessar_dlq")
+
+# Coluna que indica a versão da linha no target (e no payload do evento)
+VERSION_COLUMN = "updated_at"
+
+
+def list_pending(conn) -> None:
+    """Resumo dos eventos pendentes por topic."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT topic, COUNT(*), MIN(failed_at), MAX(attempts)
+            FROM public._pipeline_dlq
+            WHERE redriven_at IS NULL
+            GROUP BY topic
+            ORDER BY topic
+        """)
+        rows = cur.fetchall()
+    conn.commit()
+
+    if not rows:
+        logger.info("Nenhum evento pendente na DLQ.")
+    for topic, count, oldest, attempts in rows:
+        logger.info(f"{topic}: {count} pendentes | mais antigo: {oldest} | máx. tentativas: {attempts}")
+
+
+def superseded_keys(cur, cfg: dict, payloads: list[dict]) -> set:
+    """PKs cuja linha no target já é mais nova que o evento da DLQ.
+
+    Depois da falha o consumer pode ter aplicado versões posteriores da mesma
+    linha; reaplicar o evento antigo sobrescreveria esses dados. Compara
+    VERSION_COLUMN do target com a do evento. Tabelas sem essa coluna (e
+    eventos sem ela, como deletes só com a PK) não são verificados.
+    """
+    table, pk = cfg["table"], cfg["pk"]
+    if VERSION_COLUMN not in cfg["columns"]:
+        return set()
+    rows = [{pk: p[pk], VERSION_COLUMN: p[VERSION_COLUMN]} for p in payloads
+            if p.get(VERSION_COLUMN) is not None]
+    if not rows:
+        return set()
+    cur.execute(f"""
+        SELECT e.{pk}
+        FROM json_populate_recordset(NULL::{table}, %s) AS e
+        JOIN {table} AS t ON t.{pk} = e.{pk}
+        WHERE t.{VERSION_COLUMN} > e.{VERSION_COLUMN}
+    """, (json.dumps(rows, ensure_ascii=False, default=str),))
+    return {row[0] for row in cur.fetchall()}
+
+
+def redrive_chunk(conn, topic: str | None, after_id: int, size: int) -> tuple[int, int, int, int | None]:
+    """Reaplica até `size` eventos pendentes com id > after_id numa transação.
+
+    Entradas da mesma PK são compactadas como no consumer: só a versão mais
+    recente é reaplicada e as anteriores são dadas como resolvidas. Se o
+    target já tiver uma versão mais nova da linha (ver superseded_keys), as
+    entradas da PK são marcadas como superseded em vez de reaplicadas.
+    Retorna (resolvidos, superseded, com falha, último id lido).
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, topic, payload
+            FROM public._pipeline_dlq
+            WHERE redriven_at IS NULL AND id > %(after_id)s
+              AND (%(topic)s::text IS NULL OR topic = %(topic)s)
+            ORDER BY id
+            LIMIT %(size)s
+            FOR UPDATE SKIP LOCKED
+        """, {"after_id": after_id, "topic": topic, "size": size})
+        entries = cur.fetchall()
+        if not entries:
+            conn.commit()
+            return 0, 0, 0, None
+
+        by_topic = {}
+        for entry_id, entry_topic, payload in entries:
+            payload["__dlq_id"] = entry_id  # ignorado na escrita (fora de "columns")
+            by_topic.setdefault(entry_topic, []).append(payload)
+
+        resolved, superseded, failed_all = [], [], []
+        # Tabelas pais antes das filhas, como no consumer
+        for entry_topic, payloads in sorted(by_topic.items(), key=lambda item: kc.table_depth(item[0])):
+            cfg = kc.TABLE_MAP.get(entry_topic)
+            if not cfg:
+                logger.warning(f"Topic sem mapeamento em TABLE_MAP: {entry_topic} ({len(payloads)} eventos)")
+                continue
+            pk     = cfg["pk"]
+            latest = kc.compact_events(cfg, payloads)
+            stale  = superseded_keys(cur, cfg, latest)
+            stale_payloads = [p for p in payloads if p.get(pk) in stale]
+            if stale_payloads:
+                superseded.extend(p["__dlq_id"] for p in stale_payloads)
+                logger.info(f"{entry_topic}: {len(stale_payloads)} eventos com versão mais nova no target; "
+                            f"não reaplicados")
+                payloads = [p for p in payloads if p.get(pk) not in stale]
+                latest   = [p for p in latest if p[pk] not in stale]
+            failed = []
+            kc.apply_isolating(cur, entry_topic, latest, failed)
+            failed_ids = {p["__dlq_id"] for p, _ in failed}
+            resolved.extend(p["__dlq_id"] for p in payloads if p["__dlq_id"] not in failed_ids)
+            failed_all.extend((p["__dlq_id"], error) for p, error in failed)
+
+        if resolved:
+            cur.execute("""
+                UPDATE public._pipeline_dlq SET redriven_at = NOW() WHERE id = ANY(%s)
+            """, (resolved,))
+        if superseded:
+            cur.execute("""
+                UPDATE public._pipeline_dlq SET redriven_at = NOW(), superseded = TRUE WHERE id = ANY(%s)
+            """, (superseded,))
+        if failed_all:
+            psycopg2.extras.execute_values(cur, """
+                UPDATE public._pipeline_dlq AS d
+                SET attempts = d.attempts + 1, error = f.error, failed_at = NOW()
+                FROM (VALUES %s) AS f(id, error)
+                WHERE d.id = f.id
+            """, failed_all, page_size=len(failed_all))
+    conn.commit()
+    return len(resolved), len(superseded), len(failed_all), entries[-1][0]
+
+
+def redrive(conn, topic: str | None = None, limit: int | None = None,
+            chunk_size: int = 1000) -> tuple[int, int, int]:
+    """Reaplica os pendentes em lotes de `chunk_size`. Retorna (resolvidos, superseded, com falha)."""
+    resolved = skipped = failed = 0
+    after_id = 0
+    while limit is None or resolved + skipped + failed < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - resolved - skipped - failed)
+        n_ok, n_skip, n_fail, last_id = redrive_chunk(conn, topic, after_id, size)
+        if last_id is None:
+            break
+        resolved += n_ok
+        skipped  += n_skip
+        failed   += n_fail
+        after_id  = last_id
+        logger.info(f"Lote até id {last_id}: {n_ok} reaplicados, {n_skip} superseded, {n_fail} com falha")
+    return resolved, skipped, failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reprocessa eventos da DLQ do consumer CDC")
+    parser.add_argument("--topic", help="reprocessa apenas este topic")
+    parser.add_argument("--limit", type=int, help="número máximo de eventos a reprocessar")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="eventos por transação (padrão: 1000)")
+    parser.add_argument("--list", action="store_true", help="apenas lista os pendentes")
+    args = parser.parse_args()
+
+    conn = kc.get_db_conn()
+    try:
+        kc.ensure_target_schema(conn)
+        if kc.TABLE_DISCOVERY:
+            kc.refresh_table_map(conn)
+        if args.list:
+            list_pending(conn)
+            return
+        resolved, skipped, failed = redrive(conn, args.topic, args.limit, args.chunk_size)
+        logger.info(f"DLQ reprocessada: {resolved} eventos reaplicados, {skipped} superseded "
+                    f"(versão mais nova no target), {failed} continuam pendentes")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Os scripts e as APIs simuladas rodam como módulos soltos (sem pacote):
+os testes os importam pelos mesmos diretórios."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("scripts", "apis_simuladas"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+# kafka_consumer lê a configuração no import: sem servidor de métricas nem monitor de lag
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("LAG_INTERVAL_SECONDS", "0")
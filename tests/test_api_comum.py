@@ -0,0 +1,54 @@
+import gzip
+import json
+
+import api_comum
+
+REGISTROS = [{"id": i} for i in range(1, 11)]
+
+
+def ids(pagina):
+    return [r["id"] for r in pagina]
+
+
+def test_pagina_apos_sem_cursor_devolve_os_ultimos():
+    pagina, cursor = api_comum.pagina_apos(REGISTROS, None, 3)
+    assert ids(pagina) == [8, 9, 10] and cursor == 10
+
+
+def test_pagina_apos_percorre_ate_o_fim():
+    pagina, cursor = api_comum.pagina_apos(REGISTROS, 4, 3)
+    assert ids(pagina) == [5, 6, 7] and cursor == 7
+
+    pagina, cursor = api_comum.pagina_apos(REGISTROS, 9, 3)
+    assert ids(pagina) == [10] and cursor == 10
+
+    pagina, cursor = api_comum.pagina_apos(REGISTROS, 10, 3)
+    assert pagina == [] and cursor == 10
+
+
+def test_pagina_ids_filtra_pelo_indice():
+    filtrados = [2, 3, 5, 8, 9]
+
+    pagina, cursor = api_comum.pagina_ids(filtrados, REGISTROS, 3, 2)
+    assert ids(pagina) == [5, 8] and cursor == 8
+
+    pagina, cursor = api_comum.pagina_ids(filtrados, REGISTROS, None, 2)
+    assert ids(pagina) == [8, 9] and cursor == 9
+
+    pagina, cursor = api_comum.pagina_ids(filtrados, REGISTROS, 9, 2)
+    assert pagina == [] and cursor == 9
+
+
+def test_exportar_ndjson_em_blocos(monkeypatch):
+    monkeypatch.setattr(api_comum, "EXPORT_CHUNK_SIZE", 3)
+
+    blocos = list(api_comum.exportar_ndjson(REGISTROS, 2, comprimir=False))
+    linhas = b"".join(blocos).decode().splitlines()
+
+    assert len(blocos) == 3
+    assert [json.loads(linha)["id"] for linha in linhas] == list(range(3, 11))
+
+
+def test_exportar_ndjson_gzip():
+    dados = b"".join(api_comum.exportar_ndjson(REGISTROS, 0, comprimir=True))
+    assert len(gzip.decompress(dados).decode().splitlines()) == 10
@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+import fastavro
+import pytest
+
+import cdc_avro
+
+SCHEMA = {
+    "type": "record", "name": "Value", "fields": [
+        {"name": "id", "type": "long"},
+        {"name": "preco", "type": ["null", {"type": "bytes", "logicalType": "decimal",
+                                            "precision": 10, "scale": 2}], "default": None},
+        {"name": "updated_at", "type": {"type": "long", "logicalType": "timestamp-micros"}},
+        {"name": "campo_novo", "type": ["null", "string"], "default": None},
+        {"name": "__op", "type": ["null", "string"], "default": None},
+    ],
+}
+TOPIC     = "dbserver1.public.produtos"
+TABLE_MAP = {TOPIC: {"table": "public.produtos", "pk": "id", "columns": ["updated_at", "id", "preco"]}}
+
+
+def test_strip_logical_types_keeps_only_decimal():
+    fields = {f["name"]: f["type"] for f in cdc_avro._strip_logical_types(SCHEMA)["fields"]}
+
+    assert fields["updated_at"] == {"type": "long"}
+    assert fields["preco"][1] == {"type": "bytes", "logicalType": "decimal", "precision": 10, "scale": 2}
+
+
+def test_reader_schema_projects_mapped_columns_in_order():
+    reader = cdc_avro.reader_schema(SCHEMA, ["updated_at", "id", "ausente"])
+    assert [f["name"] for f in reader["fields"]] == ["updated_at", "id", "__op"]
+
+
+def test_decoder_projects_and_reports_writer_fields(tmp_path):
+    registry  = cdc_avro.FileSchemaRegistry(str(tmp_path))
+    schema_id = registry.register(SCHEMA)
+    seen      = []
+    decoder   = cdc_avro.AvroDecoder(registry, TABLE_MAP, on_writer_fields=lambda t, f: seen.append((t, f)))
+    record    = {"id": 1, "preco": Decimal("12.34"), "updated_at": 1_700_000_000_000_000,
+                 "campo_novo": "x", "__op": "c"}
+    value     = cdc_avro.encode(schema_id, fastavro.parse_schema(SCHEMA), record)
+
+    assert decoder.decode(TOPIC, value) == {"updated_at": 1_700_000_000_000_000, "id": 1,
+                                            "preco": Decimal("12.34"), "__op": "c"}
+    decoder.decode(TOPIC, value)
+    # Uma chamada por (schema id, topic), com todos os campos do writer
+    assert seen == [(TOPIC, ["id", "preco", "updated_at", "campo_novo", "__op"])]
+
+
+def test_decoder_errors(tmp_path):
+    decoder = cdc_avro.AvroDecoder(cdc_avro.FileSchemaRegistry(str(tmp_path)), TABLE_MAP)
+
+    with pytest.raises(cdc_avro.AvroDecodeError):
+        decoder.decode(TOPIC, b'{"id": 1}')
+    with pytest.raises(cdc_avro.SchemaRegistryError) as err:
+        decoder.decode(TOPIC, bytes([0]) + (42).to_bytes(4, "big") + b"\x02")
+    assert not err.value.retryable
@@ -0,0 +1,39 @@
+import cdc_metrics as metrics
+
+
+def test_histogram_render_is_cumulative():
+    hist = metrics.Histogram("t_seconds", "ajuda", (0.1, 1.0), ("topic",))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        hist.observe(value, "a")
+
+    assert hist.render() == [
+        "# HELP t_seconds ajuda",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{topic="a",le="0.1"} 2',
+        't_seconds_bucket{topic="a",le="1.0"} 3',
+        't_seconds_bucket{topic="a",le="+Inf"} 4',
+        't_seconds_sum{topic="a"} 2.65',
+        't_seconds_count{topic="a"} 4',
+    ]
+
+
+def test_histogram_render_without_labels():
+    hist = metrics.Histogram("t_size", "ajuda", (10,))
+    hist.observe(3)
+
+    assert hist.render()[2:] == ['t_size_bucket{le="10"} 1', 't_size_bucket{le="+Inf"} 1',
+                                 "t_size_sum 3.0", "t_size_count 1"]
+
+
+def test_counter_and_gauge_render():
+    counter = metrics.Counter("t_total", "ajuda", ("topic",))
+    counter.inc(2, "b")
+    counter.inc(1, "a")
+    gauge = metrics.Gauge("t_lag", "ajuda", ("topic", "partition"))
+    gauge.set(7, "a", "0")
+
+    assert counter.render()[2:] == ['t_total{topic="a"} 1', 't_total{topic="b"} 2']
+    assert gauge.render()[2:] == ['t_lag{topic="a",partition="0"} 7']
+
+    gauge.clear()
+    assert gauge.render()[2:] == []
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+# As APIs simuladas rodam no próprio container, com FastAPI e Faker
+pytest.importorskip("fastapi")
+pytest.importorskip("faker")
+
+import crm_api as api
+
+
+@pytest.fixture
+def crm(monkeypatch):
+    for nome, vazio in (("leads_db", []), ("atividades_db", []), ("leads_por_status", {}),
+                        ("atividades_por_tipo", {}), ("ids_leads_por_status", {}),
+                        ("ids_atividades_por_lead", {}), ("soma_scores", 0)):
+        monkeypatch.setattr(api, nome, vazio)
+    return api
+
+
+def ids(resposta):
+    return [r["id"] for r in resposta["dados"]]
+
+
+def test_listagens_filtradas_seguem_os_indices(crm):
+    for lead_id, status in enumerate(["Novo", "Qualificado", "Novo", "Novo", "Qualificado"], start=1):
+        crm.registrar_lead({"id": lead_id, "status": status, "score": 10})
+    crm.alterar_status_lead(crm.leads_db[2], "Qualificado")  # lead 3
+    for atividade_id, lead_id in enumerate([1, 3, 1, 2, 1], start=1):
+        crm.registrar_atividade({"id": atividade_id, "lead_id": lead_id, "tipo": "Email"})
+
+    assert ids(asyncio.run(crm.listar_leads(status="qualificado"))) == [2, 3, 5]
+    assert ids(asyncio.run(crm.listar_leads(status="Novo"))) == [1, 4]
+
+    pagina = asyncio.run(crm.listar_leads(status="qualificado", after_id=2, limit=1))
+    assert ids(pagina) == [3] and pagina["next_cursor"] == 3
+
+    assert ids(asyncio.run(crm.listar_atividades(lead_id=1))) == [1, 3, 5]
+    assert ids(asyncio.run(crm.listar_atividades(lead_id=1, after_id=1, limit=1))) == [3]
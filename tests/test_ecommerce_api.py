@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+# As APIs simuladas rodam no próprio container, com FastAPI e Faker
+pytest.importorskip("fastapi")
+pytest.importorskip("faker")
+
+import ecommerce_api as api
+
+
+def venda(venda_id, produto_id, quantidade, valor_total, status):
+    return {"id": venda_id, "produto_id": produto_id, "quantidade": quantidade,
+            "valor_total": valor_total, "status": status}
+
+
+def test_stats_refletem_as_vendas_registradas(monkeypatch):
+    for nome, vazio in (("vendas_db", []), ("vendas_ts", []), ("vendas_por_status", {}),
+                        ("vendas_por_produto", {}), ("receita_total", 0.0)):
+        monkeypatch.setattr(api, nome, vazio)
+
+    vendas = [venda(1, 7, 2, 100.0, "Entregue"), venda(2, 8, 1, 50.5, "Pendente"),
+              venda(3, 7, 3, 30.0, "Entregue"), venda(4, 9, 1, 19.5, "Enviado")]
+    for v in vendas:
+        api.registrar_venda(v, datetime(2026, 1, v["id"]))
+
+    stats = asyncio.run(api.estatisticas())
+
+    assert stats["resumo"]["total_vendas"] == 4
+    assert stats["resumo"]["receita_total"] == 200.0
+    assert stats["resumo"]["ticket_medio"] == 50.0
+    assert stats["vendas_por_status"] == {"Entregue": 2, "Pendente": 1, "Enviado": 1}
+    assert stats["top_produtos"][0] == {"produto_id": 7, "quantidade": 5}
+    assert len(stats["top_produtos"]) == 3
@@ -0,0 +1,304 @@
+import json
+import queue
+import threading
+import time
+
+import psycopg2
+import pytest
+
+import kafka_consumer as kc
+
+CLIENTES = "dbserver1.public.clientes"
+PEDIDOS  = "dbserver1.public.pedidos"
+ITENS    = "dbserver1.public.itens_pedido"
+
+
+def test_compact_events_keeps_latest_version_per_pk():
+    cfg = kc.TABLE_MAP[CLIENTES]
+    payloads = [
+        {"id": 1, "nome": "b", "__lsn": 20},
+        {"id": 1, "nome": "a", "__lsn": 10},   # fora de ordem: perde para o lsn 20
+        {"id": 2, "nome": "x", "__lsn": 5},
+        {"id": 2, "__op": "d", "__lsn": 6},    # a última versão é o delete
+        {"nome": "sem pk"},
+    ]
+
+    latest = {p["id"]: p for p in kc.compact_events(cfg, payloads)}
+
+    assert latest[1]["nome"] == "b"
+    assert latest[2]["__op"] == "d"
+    assert len(latest) == 2
+
+
+def test_compact_events_ties_follow_arrival_order():
+    cfg = kc.TABLE_MAP[CLIENTES]
+    rows = kc.compact_events(cfg, [{"id": 1, "nome": "primeiro"}, {"id": 1, "nome": "segundo"}])
+    assert rows == [{"id": 1, "nome": "segundo"}]
+
+
+def test_ordered_groups_parents_first_and_deletes_children_first():
+    batch = {
+        (ITENS, 0):    [{"id": 1, "pedido_id": 1, "__op": "c"}, {"id": 2, "__op": "d"}],
+        (PEDIDOS, 0):  [{"id": 1, "cliente_id": 1, "__op": "c"}, {"id": 2, "__op": "d"}],
+        (CLIENTES, 0): [{"id": 1, "nome": "a", "__op": "c"}],
+    }
+
+    plan = [(cfg["table"], op) for cfg, op, _, _ in kc.ordered_groups(batch)]
+
+    assert plan == [
+        ("public.itens_pedido", "d"), ("public.pedidos", "d"),
+        ("public.clientes", "u"), ("public.pedidos", "u"), ("public.itens_pedido", "u"),
+    ]
+
+
+def test_csv_field_encoding():
+    assert kc._csv_field(None) == ""
+    assert kc._csv_field("") == '""'
+    assert kc._csv_field('a"b') == '"a""b"'
+    assert kc._csv_field(True) == "t"
+    assert kc._csv_field(False) == "f"
+    assert kc._csv_field(10) == "10"
+    assert kc._csv_field({"k": "v"}) == '"{""k"": ""v""}"'
+
+
+def test_hashed_name_is_short_and_distinct():
+    long_table = "public." + "x" * 80
+    a = kc._statement_name("upsert", long_table, ("id", "a"))
+    b = kc._statement_name("upsert", long_table, ("id", "b"))
+
+    assert a != b
+    assert len(a) <= 63 and len(kc._hashed_name("_stg", long_table, "id")) <= 63
+    assert a == kc._statement_name("upsert", long_table, ("id", "a"))
+
+
+def _end(tx_id, count):
+    return {"status": "END", "id": tx_id, "event_count": count}
+
+
+def test_pending_transactions_release_in_commit_order():
+    pending = kc.PendingTransactions()
+    key, tx_key = (PEDIDOS, 0), ("dbserver1.transaction", 0)
+    pending.add_event("t1", key, 10, {"id": 1})
+    pending.add_event("t2", key, 11, {"id": 2})
+    pending.add_boundary(tx_key, 0, {"status": "BEGIN", "id": "t1"})
+    pending.add_boundary(tx_key, 1, _end("t1", 2))
+    pending.add_boundary(tx_key, 2, _end("t2", 1))
+
+    # t1 espera o segundo evento e segura t2, que já está completa
+    assert pending.release() == []
+    assert pending.positions() == {key: 10, tx_key: 1}
+
+    pending.add_event("t1", key, 12, {"id": 3})
+    released = pending.release()
+
+    assert [[offset for _, offset, _ in tx["events"]] for tx in released] == [[10, 12], [11]]
+    assert pending.open == {} and pending.positions() == {}
+
+
+def test_pending_transactions_timeout_releases_incomplete(monkeypatch):
+    pending = kc.PendingTransactions()
+    pending.add_event("t1", (PEDIDOS, 0), 5, {"id": 1})
+    pending.add_boundary(("dbserver1.transaction", 0), 0, _end("t1", 3))
+    assert pending.release() == []
+
+    monkeypatch.setattr(kc, "TRANSACTION_TIMEOUT_MS", 0)
+    assert len(pending.release()) == 1
+
+
+class Msg:
+    """Mensagem mínima com a interface de confluent_kafka.Message usada no consumer."""
+
+    def __init__(self, topic, partition, offset, payload):
+        self._topic, self._partition, self._offset = topic, partition, offset
+        self._value = json.dumps(payload).encode()
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+
+def test_decode_message_skips_payloads_that_are_not_objects():
+    for value in ([1, 2], "texto", 42, {"payload": [1]}):
+        assert kc.decode_message(Msg(CLIENTES, 0, 0, value)) is None
+    assert kc.decode_message(Msg(CLIENTES, 0, 0, {"payload": {"id": 1}})) == {"id": 1}
+
+
+class ErrorMsg(Msg):
+    def __init__(self, topic, error):
+        super().__init__(topic, 0, 0, None)
+        self._error = error
+
+    def error(self):
+        return self._error
+
+
+def test_decode_message_skips_non_fatal_kafka_errors():
+    missing = kc.KafkaError(kc.KafkaError.UNKNOWN_TOPIC_OR_PART)
+    assert kc.decode_message(ErrorMsg(ITENS, missing)) is None
+
+    fatal = kc.KafkaError(kc.KafkaError._FATAL, "fenced", fatal=True)
+    with pytest.raises(kc.KafkaException):
+        kc.decode_message(ErrorMsg(ITENS, fatal))
+
+
+class InlinePool:
+    def run(self, fn):
+        return fn(None)
+
+
+def test_worker_discard_drops_batches_queued_before_it(monkeypatch):
+    applied = []
+    monkeypatch.setattr(kc, "BATCH_SIZE", 1)
+    monkeypatch.setattr(kc, "TABLE_DISCOVERY", False)
+    monkeypatch.setattr(kc, "apply_batch", lambda conn, events, offsets, *a: applied.append(dict(offsets)))
+    worker = kc.PartitionWorker(0, InlinePool(), queue.Queue())
+    worker.inbox.put((worker.generation, [Msg(CLIENTES, 0, 1, {"id": 1, "nome": "antigo"})]))
+
+    # O discard entra na fila atrás do lote; o worker só começa depois
+    drain = threading.Thread(target=kc.drain_workers, args=([worker], "discard"))
+    drain.start()
+    while worker.inbox.qsize() < 2:
+        time.sleep(0.01)
+    worker.start()
+    drain.join(timeout=5)
+
+    worker.inbox.put((worker.generation, [Msg(CLIENTES, 0, 2, {"id": 1, "nome": "novo"})]))
+    deadline = time.time() + 5
+    while not applied and time.time() < deadline:
+        time.sleep(0.01)
+    worker.stopping.set()
+    worker.join(timeout=5)
+
+    assert not drain.is_alive()
+    assert applied == [{(CLIENTES, 0): 2}]
+
+
+class FailingCursor:
+    """Cursor que grava os comandos e falha o EXECUTE que contém a PK `bad`."""
+
+    def __init__(self, bad, error):
+        self.bad, self.error = bad, error
+        self.connection = type("Conn", (), {"closed": 0})()
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if sql.startswith("EXECUTE") and any(r["id"] == self.bad for r in json.loads(params[0])):
+            raise self.error
+
+
+def test_connection_lost_only_for_connection_errors():
+    assert kc.connection_lost(psycopg2.OperationalError("server closed the connection"))
+    assert kc.connection_lost(psycopg2.InterfaceError("connection already closed"))
+    assert not kc.connection_lost(psycopg2.errors.ProgramLimitExceeded("row is too big"))
+    assert not kc.connection_lost(psycopg2.errors.QueryCanceled("statement timeout"))
+    assert not kc.connection_lost(ValueError("x"))
+
+
+def test_apply_isolating_dead_letters_statement_level_operational_errors():
+    cur = FailingCursor(2, psycopg2.errors.ProgramLimitExceeded("row is too big"))
+    rows = [{"id": i, "nome": str(i), "__op": "c"} for i in (1, 2, 3)]
+    failed = []
+
+    kc.apply_isolating(cur, CLIENTES, rows, failed)
+
+    assert [(row["id"], error) for row, error in failed] == [(2, "row is too big")]
+    assert cur.statements.count("ROLLBACK TO SAVEPOINT isolamento") == 3
+
+
+def test_apply_isolating_reraises_connection_loss():
+    cur = FailingCursor(2, psycopg2.OperationalError("server closed the connection"))
+    with pytest.raises(psycopg2.OperationalError):
+        kc.apply_isolating(cur, CLIENTES, [{"id": 2, "nome": "x", "__op": "c"}], [])
+
+
+class FakePgPool:
+    """Substitui o ThreadedConnectionPool: entrega conexões novas e registra descartes."""
+
+    def __init__(self):
+        self.discarded, self.released = [], []
+
+    def getconn(self):
+        return type("Conn", (), {"closed": 0, "rollback": lambda self: None})()
+
+    def putconn(self, conn, close=False):
+        (self.discarded if close else self.released).append(conn)
+
+
+def _target_pool(monkeypatch):
+    monkeypatch.setattr(kc, "backoff_delay", lambda attempt: 0)
+    pool = kc.TargetPool.__new__(kc.TargetPool)
+    pool._pool, pool._last_used = FakePgPool(), {}
+    pool._healthy = lambda conn: True
+    return pool
+
+
+def test_target_pool_retries_lost_connections_on_a_new_one(monkeypatch):
+    pool = _target_pool(monkeypatch)
+    calls = []
+
+    def fn(conn):
+        calls.append(conn)
+        if len(calls) == 1:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        return "ok"
+
+    assert pool.run(fn) == "ok"
+    assert pool._pool.discarded == [calls[0]]
+    assert pool._pool.released == [calls[1]]
+
+
+def test_target_pool_reraises_statement_errors_and_keeps_the_connection(monkeypatch):
+    pool = _target_pool(monkeypatch)
+
+    def fn(conn):
+        raise psycopg2.errors.QueryCanceled("canceling statement due to statement timeout")
+
+    with pytest.raises(psycopg2.errors.QueryCanceled):
+        pool.run(fn)
+    assert not pool._pool.discarded
+    assert len(pool._pool.released) == 1
+
+
+def test_target_pool_gives_up_after_max_attempts(monkeypatch):
+    pool = _target_pool(monkeypatch)
+    monkeypatch.setattr(kc, "RECONNECT_MAX_ATTEMPTS", 3)
+
+    def fn(conn):
+        raise psycopg2.InterfaceError("connection already closed")
+
+    with pytest.raises(psycopg2.InterfaceError):
+        pool.run(fn)
+    assert len(pool._pool.discarded) == 3
+
+
+def test_refresh_tolerates_new_fields_reported_while_it_runs(monkeypatch):
+    known = {topic: set(fields) for topic, fields in kc._KNOWN_FIELDS.items()}
+    monkeypatch.setattr(kc, "_KNOWN_FIELDS", {topic: set(fields) for topic, fields in known.items()})
+    monkeypatch.setattr(kc, "_pending_fields", {CLIENTES: {"so_no_source"}, PEDIDOS: {"outro"}})
+    monkeypatch.setattr(kc, "discover_table_map", lambda conn: (dict(kc.TABLE_MAP), dict(known)))
+    monkeypatch.setattr(kc, "_catalog_version", kc._catalog_version)
+
+    # Um decoder reporta um campo novo no meio da recarga (aqui, durante o log)
+    warning = kc.logger.warning
+    def report_during_refresh(message):
+        kc.check_schema(ITENS, {"id": 1, "campo_novo": 1})
+        warning(message)
+    monkeypatch.setattr(kc.logger, "warning", report_during_refresh)
+
+    kc.refresh_table_map(None)
+    kc._refresh_requested.clear()
+
+    assert "so_no_source" in kc._KNOWN_FIELDS[CLIENTES]
+    assert kc._pending_fields == {ITENS: {"campo_novo"}}
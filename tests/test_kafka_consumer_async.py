@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("psycopg")
+
+import kafka_consumer as kc
+import kafka_consumer_async as kca
+
+
+class FakeConn:
+    async def close(self):
+        pass
+
+
+def test_discard_drops_batches_already_queued_for_writing(monkeypatch):
+    written = []
+
+    async def fake_reconnect(conn):
+        return FakeConn()
+
+    async def fake_write_batch(conn, buffer, pool):
+        written.append(dict(buffer.offsets))
+        return {}
+
+    monkeypatch.setattr(kca, "_reconnect", fake_reconnect)
+    monkeypatch.setattr(kca, "write_batch", fake_write_batch)
+
+    async def scenario():
+        fetch_queue, write_queue, commits = asyncio.Queue(), asyncio.Queue(), asyncio.Queue()
+        stale = kc.BatchBuffer()
+        stale.offsets[("dbserver1.public.clientes", 0)] = 7
+        await write_queue.put((kca._generation, stale))
+
+        # on_lost: o descarte começa antes de o estágio de escrita ver o lote
+        drained = asyncio.create_task(kca.drain(fetch_queue, commits, write=False))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(kca.decode_loop(fetch_queue, write_queue)),
+                 asyncio.create_task(kca.write_loop(write_queue, commits, {}, None))]
+        offsets = await asyncio.wait_for(drained, timeout=5)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return offsets
+
+    assert asyncio.run(scenario()) == []
+    assert written == []
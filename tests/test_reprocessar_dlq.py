@@ -0,0 +1,106 @@
+import json
+
+import psycopg2
+import psycopg2.extras
+
+import reprocessar_dlq
+
+CLIENTES = "dbserver1.public.clientes"
+
+
+class RecordingCursor:
+    """Cursor falso: grava o SQL recebido e devolve resultados pré-definidos.
+
+    `entries` são as linhas da DLQ devolvidas pelo SELECT ... FOR UPDATE,
+    `newer` as PKs que o target já tem em versão mais nova e `bad` as PKs cujo
+    UPSERT falha.
+    """
+
+    def __init__(self, entries, newer=(), bad=()):
+        self.entries, self.newer, self.bad = entries, set(newer), set(bad)
+        self.connection = RecordingConn(self)
+        self.statements = []
+        self._result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append((" ".join(sql.split()), params))
+        self._result = []
+        if sql.startswith("EXECUTE"):
+            if any(r["id"] in self.bad for r in json.loads(params[0])):
+                raise psycopg2.errors.CheckViolation("violates check constraint")
+        elif "FROM public._pipeline_dlq" in sql and sql.lstrip().startswith("SELECT"):
+            self._result = self.entries
+        elif "SELECT e.id" in sql:  # superseded_keys
+            self._result = [(r["id"],) for r in json.loads(params[0]) if r["id"] in self.newer]
+
+    def fetchall(self):
+        return self._result
+
+    def updated_ids(self, marker):
+        return [params[0] for sql, params in self.statements if sql.startswith("UPDATE") and marker in sql]
+
+
+class RecordingConn:
+    closed = 0
+
+    def __init__(self, cur):
+        self._cur, self.commits = cur, 0
+
+    def cursor(self):
+        return self._cur
+
+    def commit(self):
+        self.commits += 1
+
+
+def entry(dlq_id, pk, lsn, **fields):
+    return dlq_id, CLIENTES, {"id": pk, "nome": f"v{lsn}", "__op": "u", "__lsn": lsn, **fields}
+
+
+def redrive(cur, monkeypatch):
+    failed = []
+    monkeypatch.setattr(psycopg2.extras, "execute_values",
+                        lambda cur, sql, rows, page_size=None: failed.extend(rows))
+    result = reprocessar_dlq.redrive_chunk(cur.connection, None, 0, 100)
+    return result, failed
+
+
+def test_redrive_compacts_duplicate_entries(monkeypatch):
+    cur = RecordingCursor([entry(1, 10, 100), entry(2, 10, 200), entry(3, 11, 150)])
+
+    (resolved, superseded, failed, last_id), _ = redrive(cur, monkeypatch)
+
+    upserts = [json.loads(params[0]) for sql, params in cur.statements if sql.startswith("EXECUTE")]
+    assert [(r["id"], r["nome"]) for r in upserts[0]] == [(10, "v200"), (11, "v150")]
+    assert (resolved, superseded, failed, last_id) == (3, 0, 0, 3)
+    assert cur.updated_ids("redriven_at = NOW() WHERE") == [[1, 2, 3]]
+    assert cur.connection.commits == 1
+
+
+def test_redrive_marks_entries_with_newer_target_rows_as_superseded(monkeypatch):
+    ts = "2026-01-01T00:00:00"
+    cur = RecordingCursor([entry(1, 10, 100, updated_at=ts), entry(2, 10, 200, updated_at=ts),
+                           entry(3, 11, 150, updated_at=ts)], newer={10})
+
+    (resolved, superseded, failed, _), _ = redrive(cur, monkeypatch)
+
+    upserts = [json.loads(params[0]) for sql, params in cur.statements if sql.startswith("EXECUTE")]
+    assert [r["id"] for r in upserts[0]] == [11]
+    assert (resolved, superseded, failed) == (1, 2, 0)
+    assert cur.updated_ids("superseded = TRUE") == [[1, 2]]
+
+
+def test_redrive_keeps_failed_entries_pending_with_one_more_attempt(monkeypatch):
+    cur = RecordingCursor([entry(1, 10, 100), entry(2, 11, 100)], bad={11})
+
+    (resolved, superseded, failed, _), attempts = redrive(cur, monkeypatch)
+
+    assert (resolved, superseded, failed) == (1, 0, 1)
+    assert cur.updated_ids("redriven_at = NOW() WHERE") == [[1]]
+    assert attempts == [(2, "violates check constraint")]